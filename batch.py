@@ -0,0 +1,539 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import cv2
+import numpy as np
+import pandas as pd
+from shapely.geometry import Polygon, MultiPolygon
+import occupancy
+import kinematics
+import preprocessing
+from roi_index import shapes_key
+from settings import load_settings
+from loader import load_tracking, iter_tracking, read_body_parts
+from tracking import TrackingData, frame_coverage, format_coverage, split_body_part, individuals_of
+
+'''
+This file processes saved details without the GUI so batches can run on machines with no display.
+Nothing in here imports tkinter.
+'''
+
+
+def frame_to_time(frame_number, fps):
+    '''
+    This function finds the number of frames in standard time format
+    '''
+    total_seconds = frame_number / fps
+    minutes, seconds = divmod(total_seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{int(hours):02}:{int(minutes):02}:{int(seconds):02}"
+
+
+def shapes_from_points(saved_shapes):
+    '''
+    This function rebuilds the ROI polygons from the points saved in details or ROI files
+    '''
+    shapes = {}
+    for name, points in saved_shapes.items():
+        if isinstance(points[0][0], (float, int)):
+            #single polygon
+            shapes[name] = Polygon(points)
+        else:
+            #multipolygon (ROIs with same names)
+            shapes[name] = MultiPolygon([Polygon(p) for p in points])
+    return shapes
+
+
+def read_video_info(video_path):
+    '''
+    This function reads the frame count, fps and resolution of a video
+    '''
+    cap = cv2.VideoCapture(video_path)
+    if not cap.isOpened():
+        raise IOError(f"Could not open video {video_path}.")
+    video_info = {
+        'total_frames': int(cap.get(cv2.CAP_PROP_FRAME_COUNT)),
+        'fps': cap.get(cv2.CAP_PROP_FPS),
+        'video_width': int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        'video_height': int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+    }
+    cap.release()
+    return video_info
+
+
+def scoring_key(details):
+    '''
+    This function returns the options that decide how a detail's membership is reduced to occupancy
+    '''
+    return (details['mode'], details.get('percent', 0.5), frozenset(details['excluded_body_parts']), details.get('specific_body_part'))
+
+
+BOUT_COLUMNS = {'entries': 'entries', 'latency': 'latency', 'mean_bout': 'mean bout', 'median_bout': 'median bout', 'max_bout': 'max bout'}
+
+
+def detail_result(details, shape_names, fps, frame_counts, bouts, individuals=(), individual_counts=None, bin_counts=None, individual_bin_counts=None,
+                  kinematics_summary=None):
+    '''
+    This function builds the row for the results CSV from the frames a detail spent in each ROI and the bouts in each ROI
+    Multi animal files also get "individual:ROI" columns for the time and bouts of each individual in each ROI
+    With the kinematics setting on, each body part gets path length, mean speed and max speed columns
+    The bout table is kept under 'bouts' and the time bin table under 'bins', each is saved to its own CSV by save_results
+    '''
+    #prepare result for this video
+    result = {
+        'details_name': details['name'],
+        'video_file': details['video_path'],
+        'mode': details['mode'],
+        'start_time': frame_to_time(int(details['start_frame']), fps),
+        'end_time': frame_to_time(int(details['end_frame']), fps)
+    }
+    for shape_name, (_, total_time) in occupancy.time_in_shapes(frame_counts, shape_names, 1.0 / fps).items():
+        result[shape_name] = total_time
+    if individual_counts is not None:
+        for individual, times in occupancy.time_in_shapes_by_individual(individual_counts, individuals, shape_names, 1.0 / fps).items():
+            for shape_name, (_, total_time) in times.items():
+                result[f"{individual}:{shape_name}"] = total_time
+
+    #bouts of multi animal files have the pooled ROIs followed by each individual's ROIs
+    bout_names = list(shape_names) + [f"{individual}:{shape_name}" for individual in individuals for shape_name in shape_names]
+    for name, stats in bouts.summary(bout_names, int(details['start_frame']), 1.0 / fps).items():
+        for stat, column in BOUT_COLUMNS.items():
+            result[f"{name} {column}"] = stats[stat]
+    if kinematics_summary is not None:
+        for body_part, stats in kinematics_summary.items():
+            for stat, column in kinematics.SUMMARY_COLUMNS.items():
+                result[f"{body_part} {column}"] = stats[stat]
+    result['bouts'] = [{'details_name': details['name'], **bout} for bout in bouts.table(bout_names, 1.0 / fps)]
+    if bin_counts is not None:
+        result['bins'] = bin_table(details, shape_names, fps, bin_counts, individuals, individual_bin_counts)
+    return result
+
+
+def bin_table(details, shape_names, fps, bin_counts, individuals=(), individual_bin_counts=None):
+    '''
+    This function builds a row for each time bin of a detail with the time spent in each ROI during the bin
+    '''
+    start_frame, end_frame = int(details['start_frame']), int(details['end_frame'])
+    edges = occupancy.bin_edges(start_frame, end_frame, detail_bin_frames(details, fps))
+    rows = []
+    for i, counts in enumerate(bin_counts):
+        row = {
+            'details_name': details['name'],
+            'bin': i + 1,
+            'start_frame': int(edges[i]),
+            'end_frame': int(edges[i + 1] - 1),
+            'start_time': frame_to_time(int(edges[i]), fps),
+            'end_time': frame_to_time(int(edges[i + 1] - 1), fps),
+        }
+        row.update({shape_name: total_time for shape_name, (_, total_time) in occupancy.time_in_shapes(counts, shape_names, 1.0 / fps).items()})
+        if individual_bin_counts is not None:
+            for individual, times in occupancy.time_in_shapes_by_individual(individual_bin_counts[i], individuals, shape_names, 1.0 / fps).items():
+                row.update({f"{individual}:{shape_name}": total_time for shape_name, (_, total_time) in times.items()})
+        rows.append(row)
+    return rows
+
+
+def detail_bin_frames(details, fps):
+    '''
+    This function returns the length in frames of the time bins of a detail, None when its time bins are off
+    '''
+    return occupancy.frames_per_bin(load_settings(details.get('settings'))['bin_seconds'], fps)
+
+
+def plan_batch(saved_details):
+    '''
+    This function groups the details by tracking file and video so each file is only loaded once
+    It returns a list of groups, each a list of (index, details) pairs
+    '''
+    groups = {}
+    for i, details in enumerate(saved_details):
+        groups.setdefault((details['csv_path'], details['video_path']), []).append((i, details))
+    return list(groups.values())
+
+
+def detail_body_parts(details, body_parts):
+    '''
+    This function returns the body parts of the file that a detail uses
+    A body part mode detail only needs its body part, of every individual in multi animal files, the other modes need every body part that isn't excluded
+    '''
+    if details.get('mode') == 'specific':
+        specific_part = split_body_part(details.get('specific_body_part') or '')[1]
+        used = {details.get('specific_body_part')} | {bp for bp in body_parts if split_body_part(bp)[1] == specific_part}
+    else:
+        used = set(body_parts)
+    used -= set(details.get('excluded_body_parts', ()))
+    return [body_part for body_part in body_parts if body_part in used]
+
+
+def needed_body_parts(group, body_parts):
+    '''
+    This function returns the body parts of the file that the details in a group use, so only their columns are loaded
+    '''
+    needed = set()
+    for _, details in group:
+        #jumps in body lengths measure the animal with all of its body parts
+        try:
+            if preprocessing.needs_every_body_part(load_settings(details.get('settings'))):
+                return body_parts
+        except ValueError:
+            pass #the detail's error is reported when it is planned
+        needed.update(detail_body_parts(details, body_parts))
+    #keep at least one body part so the frames are still read
+    return [body_part for body_part in body_parts if body_part in needed] or body_parts[:1]
+
+
+def detail_kinematics(details, tracking, fps, cache):
+    '''
+    This function returns the path length and mean and max speed of each body part a detail uses during its segment, None when its kinematics setting is off
+    Details of a group share the cache, so details with the same segment only work out the kinematics once
+    '''
+    settings = load_settings(details.get('settings'))
+    if settings['kinematics'] != 'on':
+        return None
+    return kinematics.summary(cache, tracking, int(details['start_frame']), int(details['end_frame']), fps,
+                              detail_body_parts(details, tracking.body_parts), settings)
+
+
+def streamed_kinematics(details, accumulators, body_parts):
+    '''
+    This function returns the kinematics of a detail from the summaries streamed for each segment, None when its kinematics setting is off
+    '''
+    if load_settings(details.get('settings'))['kinematics'] != 'on':
+        return None
+    return accumulators[(int(details['start_frame']), int(details['end_frame']))].summary(detail_body_parts(details, body_parts))
+
+
+def score_membership(membership, likelihood, tracking, scoring):
+    '''
+    This function reduces the membership of a pass for one scoring to the (frames, ROIs) occupancy,
+    and the (frames, individuals, ROIs) occupancy for multi animal files or None otherwise
+    '''
+    in_shapes = membership.reduce(likelihood, tracking.body_parts, *scoring, tracking.total_body_parts)
+    if not tracking.individuals:
+        return in_shapes, None
+    return in_shapes, membership.reduce_individuals(likelihood, tracking.body_parts, *scoring, tracking.file_body_parts)
+
+
+def needs_whole_file(settings):
+    '''
+    This function returns True when the occupancy of a segment depends on the frames around it, so every row of the file has to be scored like in the GUI
+    '''
+    return settings['hysteresis'] > 0 or settings['min_bout'] > 0 or settings['min_gap'] > 0
+
+
+def plan_passes(group):
+    '''
+    This function sorts the details of a group into passes of details with the same ROIs, containment and preprocessing settings, each pass tests its points once
+    It returns an (index, None, error) entry for each detail that couldn't be read and the passes, each a (shapes, settings, [(index, details, scoring, (start, end))]) tuple
+    The scoring of each detail includes its debouncing settings
+    '''
+    outcomes = []
+    passes = {}
+    for i, details in group:
+        try:
+            shapes = shapes_from_points(details['shapes'])
+            settings = load_settings(details.get('settings'))
+            scoring = (scoring_key(details), settings['min_bout'], settings['min_gap'])
+            frame_range = (int(details['start_frame']), int(details['end_frame']))
+        except Exception as e:
+            outcomes.append((i, None, str(e)))
+            continue
+        key = (shapes_key(shapes), settings['containment'], settings['raster_tolerance'], settings['hysteresis'], preprocessing.preprocessing_key(settings))
+        passes.setdefault(key, (shapes, settings, []))[2].append((i, details, scoring, frame_range))
+    return outcomes, list(passes.values())
+
+
+def process_group(group, chunk_frames=None, cache_tracking=False):
+    '''
+    This function loads the video and tracking file shared by a group of details once and scores every detail in the group
+    The tracking file is streamed chunk_frames rows at a time when chunk_frames is set, otherwise it is loaded whole
+    With cache_tracking set a tracking file that isn't cached yet is parsed whole and cached, otherwise only the columns the group needs are parsed
+    It returns an (index, result, error) entry for each detail and the time the group took, it runs inside the worker processes
+    '''
+    start_time = time.perf_counter()
+    _, first_details = group[0]
+    try:
+        video_info = read_video_info(first_details['video_path'])
+        body_parts = needed_body_parts(group, read_body_parts(first_details['csv_path']))
+        if chunk_frames:
+            return stream_group(group, video_info, chunk_frames, body_parts), time.perf_counter() - start_time
+        tracking = load_tracking(first_details['csv_path'], body_parts, cache_whole_file=cache_tracking)
+    except Exception as e:
+        return [(i, None, str(e)) for i, _ in group], time.perf_counter() - start_time
+    video_size = (video_info['video_width'], video_info['video_height'])
+    print(f"{os.path.basename(first_details['csv_path'])}\n{format_coverage(frame_coverage(tracking.frames, video_info['total_frames']))}")
+
+    outcomes, passes = plan_passes(group)
+    kinematics_cache = {}
+    prepared = {} #tracking data after each preprocessing settings used by the passes
+    for shapes, settings, pass_details in passes:
+        key = preprocessing.preprocessing_key(settings)
+        if key not in prepared:
+            prepared[key] = preprocessing.preprocess(tracking, settings)
+        pass_tracking = prepared[key]
+        #test the rows spanned by the segments once, a slice keeps the memory mapped tracking data a view instead of a copy
+        span = slice(min(tracking.rows(*frame_range).start for _, _, _, frame_range in pass_details),
+                     max(tracking.rows(*frame_range).stop for _, _, _, frame_range in pass_details))
+        if any(needs_whole_file(load_settings(details.get('settings'))) for _, details, _, _ in pass_details):
+            span = slice(0, len(tracking))
+        coords = pass_tracking.coords[span]
+        membership = occupancy.packed_points_membership(coords, shapes, video_size, settings)
+
+        #reduce the span once for each scoring used, each detail then reads its segment from the prefix sums
+        indexes = {}
+        for i, details, scoring, frame_range in pass_details:
+            try:
+                if scoring not in indexes:
+                    detail_scoring, *debounce = scoring
+                    debounce = occupancy.debounce_frames(*debounce, video_info['fps'])
+                    indexes[scoring] = [occupancy.OccupancyIndex(occupancy.debounce_occupancy(in_shapes, *debounce), tracking.frames[span])
+                                        if in_shapes is not None else None
+                                        for in_shapes in score_membership(membership, coords[..., 2], tracking, detail_scoring)]
+                index, individual_index = indexes[scoring]
+                frame_counts = index.counts(*frame_range)
+                individual_counts = individual_index.counts(*frame_range) if individual_index else None
+                bouts = index.bouts(*frame_range)
+                if individual_index:
+                    bouts = occupancy.Bouts.concatenate([bouts, individual_index.bouts(*frame_range).shifted(len(shapes))])
+                #every time bin of the segment comes from the same prefix sums
+                bin_frames = detail_bin_frames(details, video_info['fps'])
+                bin_counts = index.binned_counts(*frame_range, bin_frames) if bin_frames else None
+                individual_bin_counts = individual_index.binned_counts(*frame_range, bin_frames) if bin_frames and individual_index else None
+                outcomes.append((i, detail_result(details, shapes.keys(), video_info['fps'], frame_counts, bouts, tracking.individuals, individual_counts,
+                                                  bin_counts, individual_bin_counts, detail_kinematics(details, pass_tracking, video_info['fps'], kinematics_cache)), None))
+            except Exception as e:
+                outcomes.append((i, None, str(e)))
+
+    return outcomes, time.perf_counter() - start_time
+
+
+def stream_group(group, video_info, chunk_frames, body_parts=None):
+    '''
+    This function scores a group of details while reading their tracking file one chunk at a time
+    Each detail adds the occupancy of every chunk to its own counts, so only one chunk of the file is ever in memory
+    Kinematics are added up chunk by chunk when the jump filter is on, otherwise the outliers of a segment need all of its rows so they are kept
+    The chunks are preprocessed as they are read, each preprocessing holds back the rows at the end of a chunk until the next chunk closes their gaps
+    '''
+    csv_path = group[0][1]['csv_path']
+    video_size = (video_info['video_width'], video_info['video_height'])
+    file_body_parts = read_body_parts(csv_path)
+    individuals = individuals_of(file_body_parts)
+    outcomes, passes = plan_passes(group)
+    counters = {}
+    for shapes, _, pass_details in passes:
+        for i, details, (_, *debounce), frame_range in pass_details:
+            debounce = occupancy.debounce_frames(*debounce, video_info['fps'])
+            bin_frames = detail_bin_frames(details, video_info['fps'])
+            counters[i] = (occupancy.OccupancyAccumulator(*frame_range, len(shapes), *debounce, bin_frames),
+                           occupancy.OccupancyAccumulator(*frame_range, (len(individuals), len(shapes)), *debounce, bin_frames) if individuals else None)
+    whole_file = [any(needs_whole_file(load_settings(details.get('settings'))) for _, details, _, _ in pass_details) for _, _, pass_details in passes]
+    previous = [None] * len(passes) #last membership row of each pass for the hysteresis of the next chunk
+    pass_keys = [preprocessing.preprocessing_key(settings) for _, settings, _ in passes]
+    preprocessors = {key: preprocessing.ChunkPreprocessor(settings) for key, (_, settings, _) in zip(pass_keys, passes)}
+    loaded_body_parts = body_parts or file_body_parts
+    kinematics_ranges = {} #segments with kinematics for each preprocessing that needs their rows for the outliers
+    kinematics_sums = {} #streamed kinematics of each segment for each preprocessing with the jump filter on
+    for key, (_, settings, pass_details) in zip(pass_keys, passes):
+        for _, details, _, frame_range in pass_details:
+            if load_settings(details.get('settings'))['kinematics'] != 'on':
+                continue
+            if settings['max_jump'] > 0:
+                kinematics_sums.setdefault(key, {}).setdefault(frame_range, kinematics.SummaryAccumulator(*frame_range, video_info['fps'], loaded_body_parts))
+            else:
+                kinematics_ranges.setdefault(key, []).append(frame_range)
+    if kinematics_ranges:
+        print(f"{os.path.basename(csv_path)}: the rows of the kinematics segments are kept in memory to find their outliers, "
+              "set a Max Jump per Frame to stream them")
+    kinematics_chunks = {key: [] for key in kinematics_ranges} #rows of each block inside the segments with kinematics
+    errors = {}
+    chunk_frame_indexes = [] #frame index of every chunk for the coverage summary
+
+    def score_blocks(blocks):
+        '''
+        This function adds the preprocessed rows of each preprocessing to the counters of the passes that use it
+        '''
+        for key, ranges in kinematics_ranges.items():
+            block = blocks[key]
+            if block is not None:
+                rows = block.rows(min(start for start, _ in ranges), max(end for _, end in ranges))
+                kinematics_chunks[key].append((block.coords[rows], block.frames[rows]))
+        for key, accumulators in kinematics_sums.items():
+            block = blocks[key]
+            if block is not None:
+                for accumulator in accumulators.values():
+                    accumulator.add(block.frames, block.coords)
+        for p, (shapes, settings, pass_details) in enumerate(passes):
+            block = blocks[pass_keys[p]]
+            if block is None:
+                continue
+            #only the rows of the block inside one of the segments are tested, unless the pass is debounced
+            rows = slice(0, len(block)) if whole_file[p] else block.rows(min(frame_range[0] for _, _, _, frame_range in pass_details),
+                                                                          max(frame_range[1] for _, _, _, frame_range in pass_details))
+            if rows.start == rows.stop:
+                continue
+            coords = block.coords[rows]
+            frames = block.frames[rows]
+            membership = occupancy.packed_points_membership(coords, shapes, video_size, settings, previous=previous[p])
+            previous[p] = membership.last_row()
+
+            scored = {}
+            for i, _, scoring, _ in pass_details:
+                if i in errors:
+                    continue
+                try:
+                    if scoring not in scored:
+                        scored[scoring] = score_membership(membership, coords[..., 2], block, scoring[0])
+                    for counter, in_shapes in zip(counters[i], scored[scoring]):
+                        if counter:
+                            counter.add(frames, in_shapes)
+                except Exception as e:
+                    errors[i] = str(e)
+
+    for chunk in iter_tracking(csv_path, chunk_frames, body_parts):
+        chunk_frame_indexes.append(chunk.frames)
+        score_blocks({key: preprocessor.push(chunk) for key, preprocessor in preprocessors.items()})
+    #the rows held back at the end of the file
+    score_blocks({key: preprocessor.flush() for key, preprocessor in preprocessors.items()})
+
+    frames = np.concatenate(chunk_frame_indexes) if chunk_frame_indexes else np.empty(0, dtype=np.int64)
+    print(f"{os.path.basename(csv_path)}\n{format_coverage(frame_coverage(frames, video_info['total_frames']))}")
+    segments = {}
+    for key, blocks in kinematics_chunks.items():
+        coords = (np.concatenate([coords for coords, _ in blocks]) if blocks
+                  else np.empty((0, len(loaded_body_parts), 3), dtype=np.float32))
+        segment_frames = np.concatenate([frames for _, frames in blocks]) if blocks else np.empty(0, dtype=np.int64)
+        segments[key] = TrackingData(coords, loaded_body_parts, segment_frames, file_body_parts)
+    kinematics_cache = {}
+    for key, (shapes, _, pass_details) in zip(pass_keys, passes):
+        for i, details, _, _ in pass_details:
+            if i in errors:
+                outcomes.append((i, None, errors[i]))
+                continue
+            try:
+                counter, individual_counter = counters[i]
+                individual_counts = individual_counter.frame_counts() if individual_counter else None
+                bouts = counter.bouts()
+                if individual_counter:
+                    bouts = occupancy.Bouts.concatenate([bouts, individual_counter.bouts().shifted(len(shapes))])
+                outcomes.append((i, detail_result(details, shapes.keys(), video_info['fps'], counter.frame_counts(), bouts, individuals, individual_counts,
+                                                  counter.binned_counts(), individual_counter.binned_counts() if individual_counter else None,
+                                                  streamed_kinematics(details, kinematics_sums[key], loaded_body_parts) if key in kinematics_sums
+                                                  else detail_kinematics(details, segments[key], video_info['fps'], kinematics_cache) if key in segments else None), None))
+            except Exception as e:
+                outcomes.append((i, None, str(e)))
+    return outcomes
+
+
+def run_batch(saved_details, workers=1, progress=None, chunk_frames=None, cache_tracking=False):
+    '''
+    This function processes every set of saved details, a group of details sharing a tracking file at a time, in worker processes when workers is more than 1
+    Setting chunk_frames streams each tracking file in chunks of that many frames instead of loading it whole
+    Setting cache_tracking adds the tracking files that are loaded whole to the tracking cache
+    It returns the result rows in the order of the details and a timing entry for every detail, details that fail are skipped
+    '''
+    results = [None] * len(saved_details)
+    timings = [None] * len(saved_details)
+    groups = plan_batch(saved_details)
+    completed = 0
+
+    def record(outcomes, seconds):
+        #store the results or errors of one group and report them, each detail is given an equal share of the group's time
+        nonlocal completed
+        for i, result, error in outcomes:
+            name = saved_details[i].get('name', i + 1)
+            results[i] = result
+            timings[i] = {'details_name': name, 'seconds': seconds / len(outcomes), 'error': error}
+            if error:
+                print(f"Error: Could not process details '{name}': {error}")
+        completed += len(outcomes)
+        print(f"Processed {len(outcomes)} details from {os.path.basename(saved_details[outcomes[0][0]]['csv_path'])} in {seconds:.2f} seconds")
+        if progress:
+            progress(completed)
+
+    batch_start = time.perf_counter()
+    if workers <= 1 or len(groups) <= 1:
+        for group in groups:
+            record(*process_group(group, chunk_frames, cache_tracking))
+    else:
+        #each group is independent so it is shipped to its own worker process
+        with ProcessPoolExecutor(max_workers=min(workers, len(groups))) as executor:
+            futures = [executor.submit(process_group, group, chunk_frames, cache_tracking) for group in groups]
+            for future in as_completed(futures):
+                record(*future.result())
+
+    print(f"Processed {sum(result is not None for result in results)}/{len(saved_details)} details in {time.perf_counter() - batch_start:.2f} seconds")
+    return [result for result in results if result is not None], timings
+
+
+def containment_mismatch(details, tolerance=None):
+    '''
+    This function tests the points of a detail's segment with both the exact and the raster containment and returns the fraction of points each ROI classifies differently
+    The raster uses the detail's raster tolerance unless tolerance is given
+    '''
+    video_info = read_video_info(details['video_path'])
+    shapes = shapes_from_points(details['shapes'])
+    settings = load_settings(details.get('settings'))
+    tracking = load_tracking(details['csv_path'])
+    coords = tracking.coords[tracking.rows(int(details['start_frame']), int(details['end_frame']))]
+    x, y = occupancy.scale_points(coords[..., 0], coords[..., 1], video_info['video_width'], video_info['video_height'],
+                                  occupancy.CANVAS_WIDTH, occupancy.CANVAS_HEIGHT)
+    return occupancy.compare_containment(x, y, shapes, settings['raster_tolerance'] if tolerance is None else tolerance)
+
+
+def load_manifest(manifest_path):
+    '''
+    This function loads the saved details from a manifest file exported from the GUI
+    '''
+    with open(manifest_path, 'r') as f:
+        manifest = json.load(f)
+    #the manifest can be a list of details or an object holding the list under "details"
+    if isinstance(manifest, dict):
+        manifest = manifest['details']
+    return manifest
+
+
+def bouts_file_path(results_file_path):
+    '''
+    This function returns the path of the bout table saved next to a results CSV
+    '''
+    stem, file_extension = os.path.splitext(results_file_path)
+    return f"{stem}_bouts{file_extension or '.csv'}"
+
+
+def bins_file_path(results_file_path):
+    '''
+    This function returns the path of the time bin table saved next to a results CSV
+    '''
+    stem, file_extension = os.path.splitext(results_file_path)
+    return f"{stem}_bins{file_extension or '.csv'}"
+
+
+def timings_file_path(results_file_path):
+    '''
+    This function returns the path of the timing table saved next to a results CSV
+    '''
+    stem, file_extension = os.path.splitext(results_file_path)
+    return f"{stem}_timings{file_extension or '.csv'}"
+
+
+def save_timings(timings, results_file_path):
+    '''
+    This function saves the seconds each detail took and its error, if any, to a CSV next to the results
+    '''
+    pd.DataFrame([timing for timing in timings if timing], columns=['details_name', 'seconds', 'error']).to_csv(timings_file_path(results_file_path), index=False)
+
+
+def save_results(results, results_file_path):
+    '''
+    This function saves the result rows to a single CSV and the bouts of every detail to a second CSV next to it
+    When any detail has time bins, the bins of every detail are saved to a third CSV
+    '''
+    results_df = pd.DataFrame([{key: value for key, value in result.items() if key not in ('bouts', 'bins')} for result in results])
+    results_df.to_csv(results_file_path, index=False)
+    bouts_df = pd.DataFrame([bout for result in results for bout in result.get('bouts', [])],
+                            columns=['details_name', 'roi', 'start_frame', 'end_frame', 'duration'])
+    bouts_df.to_csv(bouts_file_path(results_file_path), index=False)
+    bins = [row for result in results for row in result.get('bins', [])]
+    if bins:
+        pd.DataFrame(bins).to_csv(bins_file_path(results_file_path), index=False)
@@ -4,13 +4,13 @@ from tkinter import ttk
 from shapes import ShapeDrawer
 from processing import DataProcessor
 from video_handling import VideoHandler
+from batch import frame_to_time, run_batch, save_results, bouts_file_path, bins_file_path
+from settings import SETTING_LABELS, parse_setting, load_settings
 from utils import progress_bar, update_progress, close_progress_bar, center_window, open_website, create_custom_entry
 import threading
 import os
 import json
 from shapely.geometry import Polygon, MultiPolygon
-import pandas as pd
-import cv2
 import ctypes
 
 
@@ -133,7 +133,7 @@ class Application:
         self.start_frame = 0
         self.end_frame = None
         self.fps = None
-
+        self.settings = load_settings()  #processing settings that are saved with details
 
 
         #add widgets
@@ -215,6 +215,9 @@ class Application:
         self.show_saved_details_button = self.create_rounded_button(self.right_frame, width=130, height=40, corner_radius=15, bg_color="#455364", fg_color="white", text="Save Details", command=self.save_details_and_show)
         self.show_saved_details_button.grid(row=5, column=0, padx=5, pady=5, sticky="n")
         
+        self.settings_button = self.create_rounded_button(self.right_frame, width=130, height=40, corner_radius=15, bg_color="#455364", fg_color="white", text="Settings", command=self.change_settings)
+        self.settings_button.grid(row=6, column=0, padx=5, pady=5, sticky="n")
+        
     def _on_mouse_wheel(self, event):
         self.main_canvas.yview_scroll(int(-1 * (event.delta / 120)), "units")
     
@@ -387,6 +390,14 @@ class Application:
         time_text = "Time inside Regions Of Interest:\n"
         for roi_name, time in self.shape_drawer.time_counters.items(): #find the time spent in regions of interest
             time_text += f"{roi_name}: {time:.2f} seconds\n"
+            stats = self.shape_drawer.bout_stats.get(roi_name)
+            if stats and stats['entries']: #entries, latency and bout durations from the run length encoded occupancy
+                time_text += (f"   {stats['entries']} entries, first after {stats['latency']:.2f}s, "
+                              f"bouts {stats['mean_bout']:.2f}/{stats['median_bout']:.2f}/{stats['max_bout']:.2f}s (mean/median/max)\n")
+            elif stats:
+                time_text += "   no entries\n"
+        for individual, times in self.shape_drawer.individual_time_counters.items(): #time of each individual in multi animal files
+            time_text += f"{individual}: " + ", ".join(f"{roi_name} {time:.2f}s" for roi_name, time in times.items()) + "\n"
         self.time_label.config(text=time_text)
     
     def start_processing(self):
@@ -539,6 +550,34 @@ class Application:
         
         self.create_rounded_button(dialog, 130, 40, 20, "#455364", "white", "Apply", command=on_apply).pack(pady=10)
         center_window(dialog, 250, 175)
+    
+    def change_settings(self):
+        '''
+        This function opens a window with an entry for each processing setting
+        '''
+        dialog = tk.Toplevel()
+        dialog.title("Settings")
+        dialog.config(bg="#19232D")
+        dialog.iconbitmap(self.icon_path)
+        
+        #create an entry for each setting filled with the current value
+        setting_vars = {}
+        for key, label in SETTING_LABELS.items():
+            setting_vars[key] = tk.StringVar(value=str(self.settings[key]))
+            create_custom_entry(dialog, label, setting_vars[key]).pack()
+        
+        def on_apply():
+            try:
+                new_settings = {key: parse_setting(key, var.get()) for key, var in setting_vars.items()}
+            except ValueError as e:
+                self.custom_messagebox("Error", f"Invalid Input - {e}", "#19232D", "white")
+                return
+            self.settings.update(new_settings)
+            dialog.destroy()
+        
+        self.create_rounded_button(dialog, 130, 40, 20, "#455364", "white", "Apply", command=on_apply).pack(pady=10)
+        dialog.update_idletasks()
+        center_window(dialog, 300, dialog.winfo_reqheight())
         
         
     def update_zoom_radius(self, *args):
@@ -565,16 +604,13 @@ class Application:
         '''
         This function finds the number of frames in standard time format
         '''
-        total_seconds = frame_number / self.fps
-        minutes, seconds = divmod(total_seconds, 60)
-        hours, minutes = divmod(minutes, 60)
-        return f"{int(hours):02}:{int(minutes):02}:{int(seconds):02}"
+        return frame_to_time(frame_number, self.fps)
     
     def save_details_and_show(self):
         '''
         This function saves multiple different sets of details to process all at once.
         '''
-        if not hasattr(self, 'cap') or not hasattr(self, 'data'):
+        if not hasattr(self, 'cap') or not hasattr(self, 'tracking'):
             self.custom_messagebox("Error", "Please load a video and a CSV file first.", "#19232D", "white")
             return
     
@@ -619,7 +655,10 @@ class Application:
                     for name, shape in self.shape_drawer.shapes.items()
                 },
                 'excluded_body_parts': list(self.excluded_body_parts),
-                'mode': self.track_mode  
+                'mode': self.track_mode,
+                'percent': self.percent,
+                'specific_body_part': self.specific_body_part,
+                'settings': dict(self.settings)
             }
     
             self.saved_details.append(details)
@@ -638,66 +677,25 @@ class Application:
             self.custom_messagebox("Error", "No details saved to process.", "#19232D", "white")
             return
     
-        results = []
-    
-        for i, details in enumerate(self.saved_details):
-            #load video
-            self.cap = cv2.VideoCapture(details['video_path'])
-            if not self.cap.isOpened():
-                print(f"Error: Could not open video {details['video_path']}.")
-                continue
-    
-            self.total_frames = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
-            self.fps = self.cap.get(cv2.CAP_PROP_FPS)
-            self.frame_duration = 1.0 / self.fps
-            self.video_width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            self.video_height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    
-            #load CSV
-            self.data = pd.read_csv(details['csv_path'], header=[0, 1, 2])
-            self.csv_loaded = True
-            self.start_frame = details['start_frame']
-            self.end_frame = details['end_frame']
-    
-            #load ROIs
-            self.shape_drawer.shapes = {}
-            for name, points in details['shapes'].items():
-                if isinstance(points[0][0], (float, int)):
-                    #single polygon
-                    self.shape_drawer.shapes[name] = Polygon(points)
-                else:
-                    #multipolygon (ROIs with same names)
-                    self.shape_drawer.shapes[name] = MultiPolygon([Polygon(p) for p in points])
-    
-            self.excluded_body_parts = set(details['excluded_body_parts'])
-    
-            #process each video segment
-            self.data_processor.verify_frames()
-            self.data_processor.check_body_parts_in_shapes()
-    
-            #convert frame numbers to HH:MM:SS format
-            start_time = self.frame_to_time(self.start_frame)
-            end_time = self.frame_to_time(self.end_frame)
-    
-            #prepare result for this video
-            result = {
-                'details_name': details['name'],
-                'video_file': details['video_path'],
-                'mode': details['mode'],
-                'start_time': start_time,
-                'end_time': end_time
-            }
-            for shape_name, time in self.shape_drawer.time_counters.items():
-                result[shape_name] = time
-            results.append(result)
+        #process the details in parallel worker processes, the progress bar advances as each one finishes
+        self.progress_bar(len(self.saved_details))
+        self.update_progress(0)
+        results, timings = run_batch(self.saved_details, workers=os.cpu_count() or 1, progress=self.update_progress)
+        self.close_progress_bar()
+        
+        failed = [timing['details_name'] for timing in timings if timing['error']]
+        if failed:
+            self.custom_messagebox("Error", f"Could not process: {', '.join(map(str, failed))}", "#19232D", "white")
     
         #save results to a single CSV
         if results:
-            results_df = pd.DataFrame(results)
             results_file_path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV files", "*.csv")])
             if results_file_path:
-                results_df.to_csv(results_file_path, index=False)
-                self.custom_messagebox("Success", f"Results saved to {results_file_path}.", "#19232D", "white")
+                save_results(results, results_file_path)
+                message = f"Results saved to {results_file_path}.\nBouts saved to {bouts_file_path(results_file_path)}."
+                if any(result.get('bins') for result in results):
+                    message += f"\nTime bins saved to {bins_file_path(results_file_path)}."
+                self.custom_messagebox("Success", message, "#19232D", "white")
                 
     def show_saved_details_window(self):
         '''
@@ -727,6 +725,10 @@ class Application:
         #add a delete button
         delete_button = self.create_rounded_button(self.saved_details_window, 130, 40, 15, "#455364", "white", "Delete Detail", command=self.delete_selected_details)
         delete_button.pack(pady=10)
+        
+        #add an export button to run the details from the command line
+        export_button = self.create_rounded_button(self.saved_details_window, 130, 40, 15, "#455364", "white", "Export Details", command=self.export_saved_details)
+        export_button.pack(pady=(0, 10))
     
     def update_saved_details_listbox(self):
         '''
@@ -753,6 +755,20 @@ class Application:
             del self.saved_details[index]
         self.update_saved_details_listbox()
     
+    def export_saved_details(self):
+        '''
+        This function saves the details to a manifest file that can be processed with "python -m roi_tool batch"
+        '''
+        if not self.saved_details:
+            self.custom_messagebox("Warning", "No details saved to export.", bg_color="#19232D", fg_color="white")
+            return
+        
+        file_path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON files", "*.json")])
+        if file_path:
+            with open(file_path, 'w') as f:
+                json.dump(self.saved_details, f, indent=2)
+            print(f"Details exported to {file_path}")
+    
     def custom_messagebox(self, title, message, bg_color, fg_color):
         '''
         This function creates a custom messagebox that can be styled unlike a simple messagebox
@@ -0,0 +1,300 @@
+import warnings
+import numpy as np
+from preprocessing import MIN_COORDINATE, preprocessing_key, previous_rows
+
+'''
+This file contains the kinematics shared by the path, speed and velocity plots and the batch export.
+The positions, velocity, speed and path length of every body part in a segment are found at once on (frames, body parts) arrays,
+and kept in a small cache so opening several plots for the same segment reuses the work.
+'''
+
+IQR_FACTOR = 1.5 #values further than this many interquartile ranges outside the quartiles are outliers
+PATH_LIKELIHOOD = 0.99 #likelihood a point needs for the path plot and path length
+SPEED_LIKELIHOOD = 0.75 #likelihood a point needs for the speed and velocity plots
+MAX_CACHED = 8 #kinematics kept per cache, the oldest is dropped first
+
+SUMMARY_COLUMNS = {'path_length': 'path length', 'mean_speed': 'mean speed', 'max_speed': 'max speed'}
+
+
+def iqr_outliers(values, factor=IQR_FACTOR):
+    '''
+    This function flags the values in each column further than factor interquartile ranges outside the quartiles of the column, NaN values are never outliers
+    '''
+    if not len(values):
+        return np.zeros(values.shape, dtype=bool)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning) #columns with no values have NaN quartiles
+        q1, q3 = np.nanquantile(values, [0.25, 0.75], axis=0)
+    iqr = q3 - q1
+    return (values < q1 - factor * iqr) | (values > q3 + factor * iqr)
+
+
+def steps(frames, x, y, mask):
+    '''
+    This function returns the x and y step and the number of frames from the previous kept position to each kept position of every body part, NaN at the other rows
+    It matches taking np.diff of each body part's kept positions and frame indexes, but for every body part at once
+    '''
+    previous = previous_rows(mask)
+    has_step = mask & (previous >= 0)
+    previous = np.maximum(previous, 0)
+    dx = np.where(has_step, x - np.take_along_axis(x, previous, axis=0), np.nan)
+    dy = np.where(has_step, y - np.take_along_axis(y, previous, axis=0), np.nan)
+    frame_steps = np.where(has_step, frames[:, None] - frames[previous], 0)
+    return dx, dy, frame_steps
+
+
+class Kinematics:
+    '''
+    This class holds the positions, velocity, speed and path length of every body part in a segment as (frames, body parts) arrays
+    Rows where a body part is missing or below the likelihood threshold hold NaN, the outliers are left out of the path unless outlier_factor is None
+    The time between two positions comes from their frame indexes, so frames dropped from the tracking file don't look like fast movements
+    '''
+    def __init__(self, frames, coords, body_parts, fps, min_likelihood, start_frame=None, outlier_factor=IQR_FACTOR):
+        self.frames = frames
+        self.start_frame = int(frames[0]) if start_frame is None and len(frames) else start_frame or 0
+        self.body_parts = list(body_parts)
+        self.part_index = {body_part: i for i, body_part in enumerate(self.body_parts)}
+        self.fps = fps
+        x, y, likelihood = coords[..., 0], coords[..., 1], coords[..., 2]
+        self.valid = (np.abs(x) > MIN_COORDINATE) & (np.abs(y) > MIN_COORDINATE) & ~np.isnan(x) & ~np.isnan(y) & (likelihood >= min_likelihood)
+        self.x = np.where(self.valid, x, np.nan)
+        self.y = np.where(self.valid, y, np.nan)
+
+        #positions outside the interquartile range of their body part are left out of the path, unless the jump filter already masked the outliers
+        self.path_mask = self.valid
+        if outlier_factor is not None:
+            self.path_mask = self.path_mask & ~iqr_outliers(self.x, outlier_factor) & ~iqr_outliers(self.y, outlier_factor)
+        path_dx, path_dy, _ = steps(frames, self.x, self.y, self.path_mask)
+        self.path_lengths = np.nansum(np.hypot(path_dx, path_dy), axis=0, dtype=np.float64)
+
+        #velocity between consecutive valid positions over the time between their frames
+        dx, dy, self.frame_steps = steps(frames, self.x, self.y, self.valid)
+        seconds = np.where(self.frame_steps > 0, self.frame_steps / fps, np.nan)
+        self.vx = dx / seconds
+        self.vy = dy / seconds
+        self.distances = np.hypot(dx, dy)
+        self.speeds = self.distances / seconds
+        self.speed_mask = ~np.isnan(self.speeds)
+
+    def column(self, body_part):
+        try:
+            return self.part_index[body_part]
+        except KeyError:
+            raise ValueError(f"Could not find columns for body part: {body_part}")
+
+    def positions(self, body_part):
+        '''
+        This function returns the x and y positions of a body part on its path, without the outliers
+        '''
+        i = self.column(body_part)
+        kept = self.path_mask[:, i]
+        return self.x[kept, i], self.y[kept, i]
+
+    def path_length(self, body_part):
+        return float(self.path_lengths[self.column(body_part)])
+
+    def times(self, body_part):
+        '''
+        This function returns the time in seconds from the start of the segment of each speed and velocity of a body part
+        '''
+        i = self.column(body_part)
+        return (self.frames[self.speed_mask[:, i]] - self.start_frame) / self.fps
+
+    def speed(self, body_part):
+        '''
+        This function returns the speed of a body part in pixels per second at each of its times
+        '''
+        i = self.column(body_part)
+        return self.speeds[self.speed_mask[:, i], i]
+
+    def velocity(self, body_part):
+        '''
+        This function returns the x and y velocity of a body part in pixels per second at each of its times
+        '''
+        i = self.column(body_part)
+        kept = self.speed_mask[:, i]
+        return self.vx[kept, i], self.vy[kept, i]
+
+    def mean_speed(self, body_part):
+        '''
+        This function returns the distance a body part moved over the time it was tracked, NaN when it never moved between two valid positions
+        '''
+        i = self.column(body_part)
+        kept = self.speed_mask[:, i]
+        seconds = self.frame_steps[kept, i].sum() / self.fps
+        return float(self.distances[kept, i].sum(dtype=np.float64) / seconds) if seconds else float('nan')
+
+    def frame_speeds(self, body_part, end_frame):
+        '''
+        This function returns the speed of a body part in every frame from the start of the segment to end_frame,
+        each speed holds for the frames since the position before it and frames before the first valid position are NaN
+        '''
+        i = self.column(body_part)
+        kept = self.speed_mask[:, i]
+        frame_steps = self.frame_steps[kept, i]
+        speed_per_frame = np.full(end_frame - self.start_frame + 1, np.nan)
+        if len(frame_steps):
+            first_frame = self.frames[kept][0] - frame_steps[0] + 1
+            values = np.repeat(self.speeds[kept, i], frame_steps)
+            speed_per_frame[first_frame - self.start_frame:first_frame - self.start_frame + len(values)] = values
+        return speed_per_frame
+
+
+class KinematicsAccumulator:
+    '''
+    This class adds up the distance moved, the time between positions and the top speed of every body part over a segment one chunk of rows at a time,
+    so streamed files don't have to keep the rows of the segment in memory
+    It matches Kinematics with no outliers left out of the path, the first position of each body part in a chunk steps from its last position in the chunks before
+    '''
+    def __init__(self, start_frame, end_frame, fps, min_likelihood, num_body_parts):
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.fps = fps
+        self.min_likelihood = min_likelihood
+        self.last_positions = np.full((num_body_parts, 2), np.nan, dtype=np.float32)
+        self.last_frames = np.full(num_body_parts, -1, dtype=np.int64)
+        self.path_lengths = np.zeros(num_body_parts)
+        self.distances = np.zeros(num_body_parts) #distance over the steps with a speed
+        self.frame_steps = np.zeros(num_body_parts, dtype=np.int64)
+        self.max_speeds = np.full(num_body_parts, -np.inf)
+
+    def add(self, frames, coords):
+        rows = slice(np.searchsorted(frames, self.start_frame, 'left'), np.searchsorted(frames, self.end_frame, 'right'))
+        frames, coords = frames[rows], coords[rows]
+        if not len(frames):
+            return
+        x, y, likelihood = coords[..., 0], coords[..., 1], coords[..., 2]
+        valid = (np.abs(x) > MIN_COORDINATE) & (np.abs(y) > MIN_COORDINATE) & ~np.isnan(x) & ~np.isnan(y) & (likelihood >= self.min_likelihood)
+        x = np.where(valid, x, np.nan)
+        y = np.where(valid, y, np.nan)
+        dx, dy, frame_steps = steps(frames, x, y, valid)
+
+        #the first valid position of each body part in the chunk steps from its last one in the chunks before
+        first_rows, columns = np.nonzero(valid & (previous_rows(valid) < 0))
+        carried = self.last_frames[columns] >= 0
+        first_rows, columns = first_rows[carried], columns[carried]
+        dx[first_rows, columns] = x[first_rows, columns] - self.last_positions[columns, 0]
+        dy[first_rows, columns] = y[first_rows, columns] - self.last_positions[columns, 1]
+        frame_steps[first_rows, columns] = frames[first_rows] - self.last_frames[columns]
+
+        distances = np.hypot(dx, dy)
+        seconds = np.where(frame_steps > 0, frame_steps / self.fps, np.nan)
+        speeds = distances / seconds
+        kept = ~np.isnan(speeds)
+        self.path_lengths += np.nansum(distances, axis=0, dtype=np.float64)
+        self.distances += np.where(kept, distances, 0).sum(axis=0, dtype=np.float64)
+        self.frame_steps += np.where(kept, frame_steps, 0).sum(axis=0)
+        self.max_speeds = np.maximum(self.max_speeds, np.where(kept, speeds, -np.inf).max(axis=0))
+
+        #remember the last valid position of each body part for the next chunk
+        tracked = valid.any(axis=0)
+        last_rows = len(frames) - 1 - np.argmax(valid[::-1], axis=0)
+        columns = np.nonzero(tracked)[0]
+        self.last_positions[columns, 0] = x[last_rows[columns], columns]
+        self.last_positions[columns, 1] = y[last_rows[columns], columns]
+        self.last_frames[columns] = frames[last_rows[columns]]
+
+    def mean_speed(self, i):
+        seconds = self.frame_steps[i] / self.fps
+        return float(self.distances[i] / seconds) if seconds else float('nan')
+
+    def max_speed(self, i):
+        return float(self.max_speeds[i]) if np.isfinite(self.max_speeds[i]) else float('nan')
+
+
+class SummaryAccumulator:
+    '''
+    This class streams the summary of a segment, with the same likelihood thresholds as summary but without leaving the outliers out of the path,
+    so it is only used when the jump filter already masked them
+    '''
+    def __init__(self, start_frame, end_frame, fps, body_parts):
+        self.part_index = {body_part: i for i, body_part in enumerate(body_parts)}
+        self.path = KinematicsAccumulator(start_frame, end_frame, fps, PATH_LIKELIHOOD, len(self.part_index))
+        self.motion = KinematicsAccumulator(start_frame, end_frame, fps, SPEED_LIKELIHOOD, len(self.part_index))
+
+    def add(self, frames, coords):
+        self.path.add(frames, coords)
+        self.motion.add(frames, coords)
+
+    def summary(self, body_parts):
+        result = {}
+        for body_part in body_parts:
+            try:
+                i = self.part_index[body_part]
+            except KeyError:
+                raise ValueError(f"Could not find columns for body part: {body_part}")
+            result[body_part] = {
+                'path_length': float(self.path.path_lengths[i]),
+                'mean_speed': self.motion.mean_speed(i),
+                'max_speed': self.motion.max_speed(i),
+            }
+        return result
+
+
+def cached_kinematics(cache, tracking, start_frame, end_frame, fps, min_likelihood, settings, source=None):
+    '''
+    This function returns the kinematics of a segment from the cache, or works them out for every body part and caches them
+    tracking is the preprocessed tracking data, so the cache is keyed on the source file, segment, frame rate, likelihood threshold, outlier factor and preprocessing settings
+    '''
+    outlier_factor = None if settings['max_jump'] > 0 else IQR_FACTOR
+    key = (source, start_frame, end_frame, fps, min_likelihood, outlier_factor, preprocessing_key(settings))
+    if key not in cache:
+        if len(cache) >= MAX_CACHED:
+            cache.pop(next(iter(cache)))
+        rows = tracking.rows(start_frame, end_frame)
+        cache[key] = Kinematics(tracking.frames[rows], tracking.coords[rows], tracking.body_parts, fps, min_likelihood, start_frame, outlier_factor)
+    return cache[key]
+
+
+def summary(cache, tracking, start_frame, end_frame, fps, body_parts, settings, source=None):
+    '''
+    This function returns the path length in pixels and the mean and max speed in pixels per second of each body part during a segment,
+    with the same likelihood thresholds and filtering as the plots
+    '''
+    path = cached_kinematics(cache, tracking, start_frame, end_frame, fps, PATH_LIKELIHOOD, settings, source)
+    motion = cached_kinematics(cache, tracking, start_frame, end_frame, fps, SPEED_LIKELIHOOD, settings, source)
+    result = {}
+    for body_part in body_parts:
+        speed = motion.speed(body_part)
+        result[body_part] = {
+            'path_length': path.path_length(body_part),
+            'mean_speed': motion.mean_speed(body_part),
+            'max_speed': float(speed.max()) if len(speed) else float('nan'),
+        }
+    return result
+
+
+def window_means(values, window_length):
+    '''
+    This function returns the mean of every window of window_length consecutive values from the difference of two cumulative sums,
+    so every window is found in one pass no matter how long the windows are
+    Windows holding a NaN value are NaN
+    '''
+    values = np.asarray(values, dtype=np.float64)
+    if window_length < 1 or window_length > len(values):
+        return np.empty(0)
+    missing = np.isnan(values)
+    cumulative = np.concatenate(([0.0], np.cumsum(np.where(missing, 0.0, values))))
+    cumulative_missing = np.concatenate(([0], np.cumsum(missing)))
+    means = (cumulative[window_length:] - cumulative[:-window_length]) / window_length
+    means[cumulative_missing[window_length:] > cumulative_missing[:-window_length]] = np.nan
+    return means
+
+
+def extreme_windows(values, window_length, count=1, fastest=True):
+    '''
+    This function returns the start and mean of up to count windows of window_length values that don't overlap,
+    the windows with the highest means first when fastest is True and the lowest means first otherwise
+    '''
+    means = window_means(values, window_length)
+    #search for the highest mean either way, NaN windows can never be picked
+    scores = np.where(np.isnan(means), -np.inf, means if fastest else -means)
+    windows = []
+    for _ in range(count):
+        if not len(scores) or np.isneginf(scores.max()):
+            break
+        start = int(np.argmax(scores))
+        windows.append((start, float(means[start])))
+        #block every window that overlaps the one just picked
+        scores[max(start - window_length + 1, 0):start + window_length] = -np.inf
+    return windows
@@ -0,0 +1,186 @@
+import os
+import numpy as np
+import pandas as pd
+import tracking_cache
+from tracking import TrackingData
+
+'''
+This file reads DeepLabCut tracking files for both the GUI and batch processing.
+It works out the format of a file, finds the key of h5 files and the number of header rows of csv files,
+so single animal (scorer/bodyparts/coords) and multi animal (scorer/individuals/bodyparts/coords) files load the same way.
+'''
+
+HDF5_SIGNATURE = b'\x89HDF\r\n\x1a\n'
+DLC_HDF_KEY = '/df_with_missing' #key DeepLabCut saves its h5 files under
+PREFER_H5 = True #load the h5 file instead of a csv file of the same name when both exist, h5 files load several times faster
+
+
+def preferred_tracking_file(file_path):
+    '''
+    This function returns the h5 file saved next to a csv file with the same name when there is one, otherwise the file itself
+    '''
+    stem, file_extension = os.path.splitext(file_path)
+    if PREFER_H5 and file_extension.lower() == '.csv' and os.path.exists(stem + '.h5'):
+        return stem + '.h5'
+    return file_path
+
+
+def tracking_format(file_path):
+    '''
+    This function returns 'csv' or 'h5' for a tracking file, files with another extension are recognised by the h5 signature
+    '''
+    file_extension = os.path.splitext(file_path)[1].lower()
+    if file_extension == '.csv':
+        return 'csv'
+    if file_extension in ('.h5', '.hdf5', '.hdf'):
+        return 'h5'
+    with open(file_path, 'rb') as f:
+        if f.read(len(HDF5_SIGNATURE)) == HDF5_SIGNATURE:
+            return 'h5'
+    raise ValueError(f"Unsupported file type: {file_extension}")
+
+
+def hdf_key(store):
+    '''
+    This function returns the key of the tracking data in an open h5 file, the DeepLabCut key if it is there or else the first key
+    '''
+    keys = store.keys()
+    if not keys:
+        raise ValueError(f"No tracking data found in {store.filename}")
+    return DLC_HDF_KEY if DLC_HDF_KEY in keys else keys[0]
+
+
+def csv_header_rows(file_path):
+    '''
+    This function returns the number of header rows of a DeepLabCut csv file, 4 for multi animal files and 3 otherwise
+    '''
+    with open(file_path, 'r', newline='') as f:
+        first_cells = [f.readline().split(',')[0].strip() for _ in range(2)]
+    return 4 if first_cells[1] == 'individuals' else 3
+
+
+def read_header(file_path):
+    '''
+    This function reads only the column header of a tracking file
+    '''
+    if tracking_format(file_path) == 'csv':
+        return pd.read_csv(file_path, header=list(range(csv_header_rows(file_path))), nrows=0).columns
+    with pd.HDFStore(file_path, mode='r') as store:
+        return store.select(hdf_key(store), start=0, stop=0).columns
+
+
+def read_body_parts(file_path):
+    '''
+    This function reads only the header of a tracking file and returns its body parts in file order
+    '''
+    columns = read_header(preferred_tracking_file(file_path))
+    return list(dict.fromkeys(TrackingData.column_body_part(col) for col in columns if col[-1] in TrackingData.COORDS))
+
+
+def read_tracking_file(file_path, body_parts=None, chunk_frames=None):
+    '''
+    This function reads the columns of a tracking file for the given body parts, or every column when body_parts is None
+    It returns the dataframe, or an iterator over dataframes of chunk_frames rows when chunk_frames is set
+    '''
+    def wanted(columns):
+        return [col for col in columns if body_parts is None or (TrackingData.column_body_part(col) in body_parts and col[-1] in TrackingData.COORDS)]
+
+    if tracking_format(file_path) == 'csv': #if csv read the data accordingly from deeplabcut csv
+        if body_parts is None:
+            #the first column holds DeepLabCut's frame number, which becomes the frame index
+            return pd.read_csv(file_path, header=list(range(csv_header_rows(file_path))), index_col=0, chunksize=chunk_frames)
+        return read_csv_columns(file_path, wanted, chunk_frames)
+    return read_hdf_columns(file_path, wanted, chunk_frames) #if a h5 read accordingly with the hdf5 key
+
+
+def read_csv_columns(file_path, wanted, chunk_frames):
+    '''
+    This function parses only the wanted columns of a DeepLabCut csv file
+    pandas can't combine usecols with a multi row header, so the header is read on its own and the rows are parsed without it
+    The first column, DeepLabCut's frame number, is always read as the frame index
+    '''
+    header = read_header(file_path)
+    wanted_columns = set(wanted(header[1:]))
+    usecols = [0] + [i for i, col in enumerate(header) if i > 0 and col in wanted_columns]
+    columns = header[usecols[1:]]
+    reader = pd.read_csv(file_path, header=None, skiprows=header.nlevels, usecols=usecols, index_col=0,
+                         dtype={i: np.float32 for i in usecols[1:]}, chunksize=chunk_frames)
+    if chunk_frames is None:
+        reader.columns = columns
+        return reader
+
+    def chunks():
+        with reader:
+            for data in reader:
+                data.columns = columns
+                yield data
+    return chunks()
+
+
+def read_hdf_columns(file_path, wanted, chunk_frames):
+    '''
+    This function reads the wanted columns of a DeepLabCut h5 file, table format files are read a chunk at a time when chunk_frames is set
+    '''
+    with pd.HDFStore(file_path, mode='r') as store:
+        key = hdf_key(store)
+        storer = store.get_storer(key)
+        if not storer.is_table:
+            #files saved in the fixed format can only be read whole
+            data = store.select(key)
+            data = data[wanted(data.columns)]
+            if chunk_frames is None:
+                return data
+            return (data.iloc[start:start + chunk_frames] for start in range(0, len(data), chunk_frames))
+        columns = wanted(store.select(key, start=0, stop=0).columns)
+        if chunk_frames is None:
+            return store.select(key, columns=columns)
+
+    def chunks():
+        with pd.HDFStore(file_path, mode='r') as store:
+            for start in range(0, store.get_storer(key).nrows, chunk_frames):
+                yield store.select(key, start=start, stop=start + chunk_frames, columns=columns)
+    return chunks()
+
+
+def load_tracking(file_path, body_parts=None, use_cache=True, cache_whole_file=False):
+    '''
+    This function reads a DeepLabCut csv or h5 tracking file into tracking data, with only the columns of body_parts when it is given
+    Files that were parsed before are memory mapped from the tracking cache, so only the pages for the frames that are used are read from disk
+    Files that aren't cached yet are parsed and cached when the whole file is loaded, when body_parts is given only its columns are parsed
+    and nothing is cached unless cache_whole_file is set, then the whole file is parsed and cached for later loads
+    '''
+    file_path = preferred_tracking_file(file_path)
+    if use_cache:
+        cached = tracking_cache.load_entry(file_path, mmap_mode='r')
+        if cached is not None:
+            tracking = TrackingData(*cached)
+            return tracking if body_parts is None else tracking.select(body_parts)
+
+    if body_parts is not None and not (use_cache and cache_whole_file):
+        #only the columns of the body parts are parsed, which is faster and holds less in memory than the whole file
+        return TrackingData.from_dataframe(read_tracking_file(file_path, body_parts), read_body_parts(file_path))
+
+    tracking = TrackingData.from_dataframe(read_tracking_file(file_path))
+    if use_cache:
+        tracking_cache.store_entry(file_path, tracking.coords, tracking.body_parts, tracking.frames)
+        #swap the parsed arrays for the memory mapped copy so they don't stay in memory
+        cached = tracking_cache.load_entry(file_path, mmap_mode='r')
+        if cached is not None:
+            tracking = TrackingData(*cached)
+    return tracking if body_parts is None else tracking.select(body_parts)
+
+
+def iter_tracking(file_path, chunk_frames, body_parts=None):
+    '''
+    This function reads a DeepLabCut csv or h5 tracking file chunk_frames rows at a time and yields each chunk as tracking data
+    Only one chunk is in memory at a time so files too large to load whole can still be processed
+    '''
+    file_path = preferred_tracking_file(file_path)
+    file_body_parts = None if body_parts is None else read_body_parts(file_path)
+    chunks = read_tracking_file(file_path, body_parts, chunk_frames)
+    try:
+        for data in chunks:
+            yield TrackingData.from_dataframe(data, file_body_parts)
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
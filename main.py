@@ -1,7 +1,9 @@
 import tkinter as tk
+import multiprocessing
 from gui import Application
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() #batch worker processes start from this file in the packaged exe
     root = tk.Tk()
     app = Application(root)
     root.mainloop()
\ No newline at end of file
@@ -0,0 +1,613 @@
+import numpy as np
+import shapely
+from roi_index import get_roi_index, shapes_key
+from tracking import split_body_part, individuals_of
+
+'''
+This file contains the vectorized functions used to work out when the tracked animal is inside the regions of interest.
+Every function works on whole arrays of frames at once instead of looping through the frames one at a time.
+'''
+
+#likelihood a body part needs to be counted in any part mode
+ANY_PART_LIKELIHOOD = 0.99
+
+#fixed size of the canvas the ROIs are drawn on
+CANVAS_WIDTH = 1056
+CANVAS_HEIGHT = 594
+
+#frames processed at a time when working through a whole file, a multiple of 8 so bit packed blocks line up
+CHUNK_FRAMES = 65536
+
+
+def scale_points(x, y, video_width, video_height, canvas_width, canvas_height):
+    '''
+    This function scales arrays of coordinates from the video to the size of the canvas the ROIs were drawn on
+    '''
+    scaled_x = (x / video_width) * canvas_width
+    scaled_y = (y / video_height) * canvas_height
+    return scaled_x, scaled_y
+
+
+class RasterMask:
+    '''
+    This class burns every ROI into a bit packed lookup image so a point can be classified against all ROIs with a single array lookup
+    '''
+    def __init__(self, shapes, tolerance=1.0):
+        self.cell_size = float(tolerance) #width and height of a raster cell, points closer than this to a boundary may be misclassified
+        if self.cell_size <= 0:
+            raise ValueError("Raster tolerance must be greater than 0")
+        self.num_shapes = len(shapes)
+
+        #the raster only needs to cover the area the ROIs take up
+        min_x, min_y, max_x, max_y = shapely.total_bounds(list(shapes.values()))
+        if np.isnan(min_x): #every ROI is empty, for example when shrunk by the hysteresis
+            min_x, min_y, max_x, max_y = 0.0, 0.0, 1.0, 1.0
+        self.origin = (min_x, min_y)
+        self.num_cols = max(int(np.ceil((max_x - min_x) / self.cell_size)), 1)
+        self.num_rows = max(int(np.ceil((max_y - min_y) / self.cell_size)), 1)
+
+        #test the cell centres inside the bounds of each ROI
+        bits = np.zeros((self.num_rows, self.num_cols, self.num_shapes), dtype=bool)
+        for i, polygon in enumerate(shapes.values()):
+            if polygon.is_empty:
+                continue
+            shape_min_x, shape_min_y, shape_max_x, shape_max_y = polygon.bounds
+            (col_start, col_end), (row_start, row_end) = self.cells([shape_min_x, shape_max_x], [shape_min_y, shape_max_y])
+            centre_x = min_x + (np.arange(col_start, col_end + 1) + 0.5) * self.cell_size
+            centre_y = min_y + (np.arange(row_start, row_end + 1) + 0.5) * self.cell_size
+            grid_x, grid_y = np.meshgrid(centre_x, centre_y)
+            bits[row_start:row_end + 1, col_start:col_end + 1, i] = shapely.contains_xy(polygon, grid_x, grid_y)
+
+        #pack the ROI axis into bytes so the image stays small with dozens of ROIs
+        self.mask = np.packbits(bits, axis=-1)
+
+    def cells(self, x, y):
+        '''
+        This function returns the clipped column and row of the raster cell each point falls in
+        '''
+        col = np.clip(np.floor((np.asarray(x) - self.origin[0]) / self.cell_size), 0, self.num_cols - 1).astype(np.intp)
+        row = np.clip(np.floor((np.asarray(y) - self.origin[1]) / self.cell_size), 0, self.num_rows - 1).astype(np.intp)
+        return col, row
+
+    def contains(self, x, y):
+        '''
+        This function classifies every point against every ROI and returns a boolean array of shape x.shape + (ROIs,)
+        '''
+        #points outside the raster or with missing coordinates are outside every ROI
+        rel_x = (x - self.origin[0]) / self.cell_size
+        rel_y = (y - self.origin[1]) / self.cell_size
+        inside = (rel_x >= 0) & (rel_x < self.num_cols) & (rel_y >= 0) & (rel_y < self.num_rows)
+
+        col, row = self.cells(np.where(inside, x, self.origin[0]), np.where(inside, y, self.origin[1]))
+        membership = np.unpackbits(self.mask[row, col], axis=-1, count=self.num_shapes).astype(bool)
+        membership &= inside[..., None]
+        return membership
+
+
+#raster masks already built, keyed on the ROIs and tolerance
+_raster_cache = {}
+
+def get_raster_mask(shapes, tolerance):
+    '''
+    This function returns the raster mask for the ROIs, building it only when the ROIs or tolerance change
+    '''
+    key = (shapes_key(shapes), float(tolerance))
+    if key not in _raster_cache:
+        if len(_raster_cache) >= 4: #keep the ROIs and their grown and shrunk copies for the hysteresis
+            _raster_cache.pop(next(iter(_raster_cache)))
+        _raster_cache[key] = RasterMask(shapes, tolerance)
+    return _raster_cache[key]
+
+
+def compute_membership(x, y, shapes, progress=None, backend='exact', tolerance=1.0):
+    '''
+    This function tests every point against every ROI and returns a boolean array of shape (frames, body parts, ROIs)
+    The exact backend runs polygon tests through the ROI index, the raster backend looks the points up in a prebuilt raster mask
+    '''
+    if backend == 'raster':
+        membership = get_raster_mask(shapes, tolerance).contains(x, y)
+        if progress:
+            progress(len(shapes))
+        return membership
+    elif backend != 'exact':
+        raise ValueError(f"Unknown containment backend: {backend}")
+
+    return get_roi_index(shapes).contains(x, y, progress)
+
+
+def compare_containment(x, y, shapes, tolerance=1.0):
+    '''
+    This function compares the raster backend against the exact polygon tests and returns the fraction of points that disagree for each ROI
+    '''
+    exact = compute_membership(x, y, shapes, backend='exact')
+    raster = compute_membership(x, y, shapes, backend='raster', tolerance=tolerance)
+    mismatch = (exact != raster).reshape(-1, len(shapes)).mean(axis=0)
+    return dict(zip(shapes.keys(), mismatch.tolist()))
+
+
+def points_membership(coords, shapes, video_size, settings, progress=None, previous=None):
+    '''
+    This function scales an array of tracked points of shape (frames, body parts, 3) to the canvas and tests them against the ROIs
+    With hysteresis, previous is the (body parts, ROIs) membership of the row before the first row, or None at the start of the file
+    '''
+    x, y = scale_points(coords[..., 0], coords[..., 1], video_size[0], video_size[1], CANVAS_WIDTH, CANVAS_HEIGHT)
+    if settings['hysteresis'] > 0:
+        return hysteresis_membership(x, y, shapes, settings, progress, previous)
+    return compute_membership(x, y, shapes, progress, backend=settings['containment'], tolerance=settings['raster_tolerance'])
+
+
+#ROIs grown and shrunk by the hysteresis distance, keyed on the ROIs and the distance
+_buffer_cache = {}
+
+def buffered_shapes(shapes, distance):
+    '''
+    This function returns the ROIs grown by distance, or shrunk for a negative distance
+    '''
+    key = (shapes_key(shapes), distance)
+    if key not in _buffer_cache:
+        if len(_buffer_cache) >= 8:
+            _buffer_cache.pop(next(iter(_buffer_cache)))
+        _buffer_cache[key] = {name: polygon.buffer(distance) for name, polygon in shapes.items()}
+    return _buffer_cache[key]
+
+
+def hysteresis_membership(x, y, shapes, settings, progress=None, previous=None):
+    '''
+    This function tests points against the ROIs with hysteresis, a point only enters an ROI once it is the hysteresis distance inside the boundary
+    and only leaves once it is the hysteresis distance outside, in between it keeps the membership of the row before
+    '''
+    distance = settings['hysteresis']
+    backend = dict(backend=settings['containment'], tolerance=settings['raster_tolerance'])
+    inside = compute_membership(x, y, buffered_shapes(shapes, -distance), **backend)
+    near = compute_membership(x, y, buffered_shapes(shapes, distance), progress, **backend)
+
+    #rows that decide the membership, every other row takes the membership of the last deciding row
+    decided = inside | ~near
+    rows = np.arange(len(decided)).reshape((-1,) + (1,) * (decided.ndim - 1))
+    last_decided = np.maximum.accumulate(np.where(decided, rows, -1), axis=0)
+    membership = np.take_along_axis(inside, np.maximum(last_decided, 0), axis=0)
+    if previous is None:
+        previous = np.zeros(decided.shape[1:], dtype=bool)
+    return np.where(last_decided >= 0, membership, previous)
+
+
+def reduce_membership(membership, likelihood, body_parts, mode, percent=0.5, excluded_body_parts=(), specific_body_part=None, total_body_parts=None):
+    '''
+    This function reduces the membership array to a boolean array of shape (frames, ROIs) that is true when the animal counts as inside the ROI
+    total_body_parts is the number of body parts in the file when only some of them were loaded
+    '''
+    #mask of the body parts that are not excluded
+    included = np.array([bp not in excluded_body_parts for bp in body_parts], dtype=bool)
+    num_frames, num_body_parts, num_shapes = membership.shape
+    if total_body_parts is not None:
+        num_body_parts = total_body_parts
+
+    if mode == 'majority':
+        #the threshold uses every body part in the file, excluded or not
+        #each body part inside counts once, older versions counted its x and y columns separately so every part inside counted twice
+        in_shape_count = np.count_nonzero(membership[:, included, :], axis=1)
+        return in_shape_count >= percent * num_body_parts
+    elif mode == 'specific':
+        if specific_body_part not in body_parts or specific_body_part in excluded_body_parts:
+            return np.zeros((num_frames, num_shapes), dtype=bool)
+        return membership[:, list(body_parts).index(specific_body_part), :].copy()
+    elif mode == 'any_part':
+        confident = likelihood >= ANY_PART_LIKELIHOOD
+        return (membership & confident[:, :, None])[:, included, :].any(axis=1)
+    else:
+        raise ValueError(f"Unknown tracking mode: {mode}")
+
+
+def reduce_individuals(membership, likelihood, body_parts, mode, percent=0.5, excluded_body_parts=(), specific_body_part=None, file_body_parts=None):
+    '''
+    This function reduces the membership of a multi animal file to a boolean array of shape (frames, individuals, ROIs),
+    scoring each individual on its own body parts with the same rules as reduce_membership
+    file_body_parts is every body part in the file when only some of them were loaded
+    '''
+    file_body_parts = body_parts if file_body_parts is None else file_body_parts
+    individuals = individuals_of(file_body_parts)
+    owners = [split_body_part(bp)[0] for bp in body_parts]
+    num_frames, _, num_shapes = membership.shape
+
+    #(body parts, individuals) matrix of the included body parts each individual owns
+    included = np.array([[owner == individual and bp not in excluded_body_parts for individual in individuals]
+                         for bp, owner in zip(body_parts, owners)], dtype=np.float32).reshape(len(body_parts), len(individuals))
+
+    if mode == 'majority':
+        #each individual's threshold uses every body part it has in the file, excluded or not
+        parts_per_individual = np.array([sum(split_body_part(bp)[0] == individual for bp in file_body_parts) for individual in individuals])
+        in_shape_count = np.matmul(membership.transpose(0, 2, 1).astype(np.float32), included) #(frames, ROIs, individuals)
+        return (in_shape_count >= percent * parts_per_individual).transpose(0, 2, 1)
+    elif mode == 'specific':
+        #the same body part of every individual
+        part = split_body_part(specific_body_part)[1] if specific_body_part else None
+        in_shapes = np.zeros((num_frames, len(individuals), num_shapes), dtype=bool)
+        for i, individual in enumerate(individuals):
+            body_part = f"{individual}:{part}"
+            if body_part in body_parts and body_part not in excluded_body_parts:
+                in_shapes[:, i, :] = membership[:, body_parts.index(body_part), :]
+        return in_shapes
+    elif mode == 'any_part':
+        confident = membership & (likelihood >= ANY_PART_LIKELIHOOD)[:, :, None]
+        return (np.matmul(confident.transpose(0, 2, 1).astype(np.float32), included) > 0).transpose(0, 2, 1)
+    else:
+        raise ValueError(f"Unknown tracking mode: {mode}")
+
+
+class PackedMembership:
+    '''
+    This class keeps a (frames, body parts, ROIs) membership array bit packed along the frames so it can be cached and re-scored cheaply
+    '''
+    def __init__(self, packed, shape):
+        self.shape = shape #(frames, body parts, ROIs) shape of the unpacked membership
+        self.packed = packed #membership bit packed along axis 0
+
+    @classmethod
+    def from_membership(cls, membership):
+        return cls(np.packbits(membership, axis=0), membership.shape)
+
+    def unpack(self, start, end):
+        '''
+        This function returns the (frames, body parts, ROIs) membership of the rows from start to end, start has to be a multiple of 8
+        '''
+        return np.unpackbits(self.packed[start // 8:(end + 7) // 8], axis=0, count=end - start).view(bool)
+
+    def last_row(self):
+        '''
+        This function returns the (body parts, ROIs) membership of the last row, which the hysteresis of the next block carries on from
+        '''
+        num_frames = self.shape[0]
+        return self.unpack((num_frames - 1) // 8 * 8, num_frames)[-1] if num_frames else None
+
+    def reduce(self, likelihood, body_parts, mode, percent=0.5, excluded_body_parts=(), specific_body_part=None, total_body_parts=None, chunk_frames=CHUNK_FRAMES):
+        '''
+        This function reduces the membership to (frames, ROIs) occupancy one block of frames at a time so only one block is ever unpacked
+        '''
+        return self.reduce_blocks(reduce_membership, chunk_frames, likelihood, body_parts, mode, percent,
+                                  excluded_body_parts, specific_body_part, total_body_parts)
+
+    def reduce_individuals(self, likelihood, body_parts, mode, percent=0.5, excluded_body_parts=(), specific_body_part=None, file_body_parts=None, chunk_frames=CHUNK_FRAMES):
+        '''
+        This function reduces the membership to (frames, individuals, ROIs) occupancy one block of frames at a time
+        '''
+        return self.reduce_blocks(reduce_individuals, chunk_frames, likelihood, body_parts, mode, percent,
+                                  excluded_body_parts, specific_body_part, file_body_parts)
+
+    def reduce_blocks(self, reducer, chunk_frames, likelihood, body_parts, *options):
+        num_frames = self.shape[0]
+        blocks = [reducer(self.unpack(start, min(start + chunk_frames, num_frames)), likelihood[start:start + chunk_frames], list(body_parts), *options)
+                  for start in range(0, max(num_frames, 1), chunk_frames)]
+        return np.concatenate(blocks)
+
+
+def packed_points_membership(coords, shapes, video_size, settings, progress=None, chunk_frames=CHUNK_FRAMES, previous=None):
+    '''
+    This function tests the tracked points against the ROIs one block of frames at a time and bit packs each block as it goes
+    Only one block of coordinates is read at a time, so a memory mapped file is paged in a block at a time as well
+    previous is the membership of the row before the first row, which the hysteresis carries on from
+    '''
+    num_frames, num_body_parts, _ = coords.shape
+    packed = np.empty(((num_frames + 7) // 8, num_body_parts, len(shapes)), dtype=np.uint8)
+    for i, start in enumerate(range(0, num_frames, chunk_frames)):
+        end = min(start + chunk_frames, num_frames)
+        membership = points_membership(coords[start:end], shapes, video_size, settings, previous=previous)
+        packed[start // 8:(end + 7) // 8] = np.packbits(membership, axis=0)
+        previous = membership[-1]
+        if progress:
+            progress(i + 1)
+    return PackedMembership(packed, (num_frames, num_body_parts, len(shapes)))
+
+
+def num_chunks(num_frames, chunk_frames=CHUNK_FRAMES):
+    return -(-num_frames // chunk_frames)
+
+
+class OccupancyIndex:
+    '''
+    This class stores the cumulative number of frames spent in each ROI so the frames in any segment can be found with two lookups
+    The occupancy itself isn't kept, only its bouts, so the index takes 4 bytes per frame and ROI plus the bouts
+    '''
+    def __init__(self, occupancy, frames):
+        self.frames = frames #frame index of each row
+        #int32 holds the frame counts of recordings up to 2^31 frames, over a year at 60 fps
+        self.cumulative = np.zeros((len(frames) + 1,) + occupancy.shape[1:], dtype=np.int32)
+        np.cumsum(occupancy, axis=0, out=self.cumulative[1:])
+        self.file_bouts = Bouts.from_occupancy(flatten_rois(occupancy), frames) #bouts of the whole file, individual major columns for multi animal files
+        self.num_columns = int(np.prod(occupancy.shape[1:]))
+
+    def rows(self, start_frame, end_frame):
+        start = np.searchsorted(self.frames, start_frame, side='left')
+        end = max(np.searchsorted(self.frames, end_frame, side='right'), start)
+        return slice(int(start), int(end))
+
+    def counts(self, start_frame, end_frame):
+        '''
+        This function returns the number of frames spent in each ROI from start_frame to end_frame inclusive
+        '''
+        rows = self.rows(start_frame, end_frame)
+        return self.cumulative[rows.stop] - self.cumulative[rows.start]
+
+    def bouts(self, start_frame, end_frame):
+        '''
+        This function returns the bouts in each ROI from start_frame to end_frame inclusive, the occupancy of multi animal files is flattened to individual major columns
+        '''
+        rows = self.rows(start_frame, end_frame)
+        if rows.start == rows.stop:
+            return Bouts.from_occupancy(np.zeros((0, self.num_columns), dtype=bool), self.frames[rows])
+        #cut the bouts of the file down to the segment, with the rows counted from the start of the segment
+        bouts = self.file_bouts.clipped(rows.start, rows.stop - 1, self.frames[rows.start], self.frames[rows.stop - 1])
+        return Bouts(bouts.shape_positions, bouts.start_rows - rows.start, bouts.end_rows - rows.start, bouts.start_frames, bouts.end_frames)
+
+    def binned_counts(self, start_frame, end_frame, bin_frames):
+        '''
+        This function returns the number of frames spent in each ROI in each bin of bin_frames frames from start_frame to end_frame,
+        the difference of the prefix sums at the bin edges gives every bin at once like np.add.reduceat
+        '''
+        edge_rows = np.searchsorted(self.frames, bin_edges(start_frame, end_frame, bin_frames), side='left')
+        return np.diff(self.cumulative[edge_rows], axis=0)
+
+
+class OccupancyAccumulator:
+    '''
+    This class collects the bouts in each ROI from blocks of occupancy and works out the frames spent in each ROI during a segment,
+    so a file can be scored a chunk at a time
+    '''
+    def __init__(self, start_frame, end_frame, shape, min_bout=0, min_gap=0, bin_frames=None):
+        self.start_frame = start_frame
+        self.end_frame = end_frame
+        self.shape = shape #(ROIs,) or (individuals, ROIs) shape of the occupancy
+        self.min_bout = min_bout #debouncing in frames
+        self.min_gap = min_gap
+        self.bout_blocks = [] #bouts of each block added
+        self.rows_added = 0
+        self.segment_rows = None #first row, last row, first frame and last frame of the segment
+        #first frame of each time bin and the row it starts on once a block reaches it, -1 until then
+        self.bin_edges = bin_edges(start_frame, end_frame, bin_frames) if bin_frames else None
+        self.edge_rows = np.full(len(self.bin_edges), -1, dtype=np.int64) if bin_frames else None
+
+    def add(self, frames, occupancy):
+        '''
+        This function adds the occupancy of the next block of rows, rows outside the segment are only used for debouncing
+        '''
+        in_segment = np.flatnonzero((frames >= self.start_frame) & (frames <= self.end_frame))
+        if len(in_segment):
+            first_row, first_frame = (self.rows_added + in_segment[0], frames[in_segment[0]]) if self.segment_rows is None else self.segment_rows[::2]
+            self.segment_rows = (first_row, self.rows_added + in_segment[-1], first_frame, frames[in_segment[-1]])
+        if self.bin_edges is not None:
+            local_rows = np.searchsorted(frames, self.bin_edges, side='left')
+            reached = (local_rows < len(frames)) & (self.edge_rows < 0)
+            self.edge_rows[reached] = self.rows_added + local_rows[reached]
+        #bouts are found per block and merged across the block boundaries once every block is added
+        self.bout_blocks.append(Bouts.from_occupancy(flatten_rois(occupancy), frames, self.rows_added))
+        self.rows_added += len(frames)
+
+    def bouts(self):
+        '''
+        This function returns the debounced bouts of the segment
+        '''
+        bouts = Bouts.concatenate(self.bout_blocks if self.segment_rows else []).debounced(self.min_bout, self.min_gap)
+        return bouts.clipped(*self.segment_rows) if self.segment_rows else bouts
+
+    def frame_counts(self):
+        '''
+        This function returns the frames spent in each ROI during the segment
+        '''
+        return self.bouts().frame_counts(self.shape)
+
+    def binned_counts(self):
+        '''
+        This function returns the frames spent in each ROI in each time bin of the segment, None when binning is off
+        '''
+        if self.bin_edges is None:
+            return None
+        #edges past the last block added start after the last row
+        edge_rows = np.where(self.edge_rows < 0, self.rows_added, self.edge_rows)
+        return self.bouts().binned_counts(edge_rows, self.shape)
+
+
+def bin_edges(start_frame, end_frame, bin_frames):
+    '''
+    This function returns the first frame of each time bin of bin_frames frames from start_frame to end_frame, followed by the frame after end_frame
+    The last bin is shorter when the segment doesn't divide into whole bins
+    '''
+    return np.append(np.arange(start_frame, end_frame + 1, bin_frames), end_frame + 1)
+
+
+def frames_per_bin(bin_seconds, fps):
+    '''
+    This function converts the time bin setting from seconds to frames, None when binning is off
+    '''
+    return max(int(round(bin_seconds * fps)), 1) if bin_seconds > 0 else None
+
+
+def debounce_frames(min_bout, min_gap, fps):
+    '''
+    This function converts the minimum bout and minimum gap settings from seconds to frames
+    '''
+    return int(round(min_bout * fps)), int(round(min_gap * fps))
+
+
+def debounce_occupancy(occupancy, min_bout, min_gap):
+    '''
+    This function debounces (frames, ROIs) or (frames, individuals, ROIs) occupancy by run length encoding it, merging short gaps,
+    dropping short bouts and decoding it again
+    '''
+    if min_bout <= 0 and min_gap <= 0:
+        return occupancy
+    flat = flatten_rois(occupancy)
+    bouts = Bouts.from_occupancy(flat, np.arange(len(flat))).debounced(min_bout, min_gap)
+    return bouts.to_occupancy(*flat.shape).reshape(occupancy.shape)
+
+
+def flatten_rois(occupancy):
+    '''
+    This function flattens (frames, individuals, ROIs) occupancy to individual major (frames, individuals * ROIs) columns
+    '''
+    return occupancy.reshape(occupancy.shape[0], int(np.prod(occupancy.shape[1:])))
+
+
+class Bouts:
+    '''
+    This class holds the run length encoded occupancy of a segment, one entry per bout with the ROI, the first and last row and the first and last frame
+    '''
+    def __init__(self, shape_positions, start_rows, end_rows, start_frames, end_frames):
+        self.shape_positions = shape_positions #ROI of each bout
+        self.start_rows = start_rows #first and last row of each bout
+        self.end_rows = end_rows
+        self.start_frames = start_frames #first and last frame of each bout
+        self.end_frames = end_frames
+
+    @classmethod
+    def from_occupancy(cls, occupancy, frames, row_offset=0):
+        '''
+        This function finds the bouts in a (frames, ROIs) occupancy array from where each ROI's occupancy switches on and off
+        '''
+        #pad with a row of False on each side so every bout has a start and an end, transposed so the bouts come out ordered by ROI
+        padded = np.zeros((occupancy.shape[1], occupancy.shape[0] + 2), dtype=np.int8)
+        padded[:, 1:-1] = occupancy.T
+        edges = np.diff(padded, axis=1)
+        shape_positions, start_rows = np.nonzero(edges == 1)
+        end_rows = np.nonzero(edges == -1)[1] - 1
+        return cls(shape_positions, start_rows + row_offset, end_rows + row_offset, frames[start_rows], frames[end_rows])
+
+    @classmethod
+    def concatenate(cls, bouts):
+        '''
+        This function joins the bouts found in consecutive blocks of rows, merging the bouts that run over the boundary between two blocks
+        '''
+        fields = [np.concatenate([getattr(b, name) for b in bouts]) if bouts else np.empty(0, dtype=np.int64)
+                  for name in ('shape_positions', 'start_rows', 'end_rows', 'start_frames', 'end_frames')]
+        shape_positions, start_rows, end_rows, start_frames, end_frames = fields
+        order = np.lexsort((start_rows, shape_positions))
+        shape_positions, start_rows, end_rows, start_frames, end_frames = (field[order] for field in fields)
+
+        #a bout continues the previous bout of the same ROI when it starts on the very next row
+        return cls(shape_positions, start_rows, end_rows, start_frames, end_frames).merge_gaps(1)
+
+    def shifted(self, offset):
+        '''
+        This function returns the bouts with the ROI positions moved by offset, so bouts of different occupancy arrays can be concatenated
+        '''
+        return Bouts(self.shape_positions + offset, self.start_rows, self.end_rows, self.start_frames, self.end_frames)
+
+    def merge_gaps(self, min_gap):
+        '''
+        This function merges the bouts of the same ROI separated by fewer than min_gap rows, the bouts have to be ordered by ROI and row
+        '''
+        new_bout = np.ones(len(self.shape_positions), dtype=bool)
+        new_bout[1:] = (self.shape_positions[1:] != self.shape_positions[:-1]) | (self.start_rows[1:] - self.end_rows[:-1] - 1 >= min_gap)
+        last_of_bout = np.ones(len(new_bout), dtype=bool)
+        last_of_bout[:-1] = new_bout[1:]
+        return Bouts(self.shape_positions[new_bout], self.start_rows[new_bout], self.end_rows[last_of_bout],
+                     self.start_frames[new_bout], self.end_frames[last_of_bout])
+
+    def debounced(self, min_bout, min_gap):
+        '''
+        This function removes border jitter from the bouts, first merging bouts separated by fewer than min_gap rows and then dropping bouts shorter than min_bout rows
+        '''
+        bouts = self.merge_gaps(min_gap) if min_gap > 0 else self
+        if min_bout > 0:
+            keep = bouts.durations() >= min_bout
+            bouts = Bouts(bouts.shape_positions[keep], bouts.start_rows[keep], bouts.end_rows[keep], bouts.start_frames[keep], bouts.end_frames[keep])
+        return bouts
+
+    def clipped(self, first_row, last_row, first_frame, last_frame):
+        '''
+        This function cuts the bouts down to the rows from first_row to last_row, whose frames are first_frame and last_frame
+        '''
+        keep = (self.end_rows >= first_row) & (self.start_rows <= last_row)
+        start_rows, end_rows = self.start_rows[keep], self.end_rows[keep]
+        return Bouts(self.shape_positions[keep], np.maximum(start_rows, first_row), np.minimum(end_rows, last_row),
+                     np.where(start_rows < first_row, first_frame, self.start_frames[keep]),
+                     np.where(end_rows > last_row, last_frame, self.end_frames[keep]))
+
+    def to_occupancy(self, num_rows, num_columns):
+        '''
+        This function turns the bouts back into a (rows, ROIs) occupancy array, the rows have to start at 0
+        '''
+        changes = np.zeros((num_rows + 1, num_columns), dtype=np.int32)
+        np.add.at(changes, (self.start_rows, self.shape_positions), 1)
+        np.add.at(changes, (self.end_rows + 1, self.shape_positions), -1)
+        return np.cumsum(changes[:-1], axis=0) > 0
+
+    def frame_counts(self, shape):
+        '''
+        This function returns the number of frames spent in each ROI, in the (ROIs,) or (individuals, ROIs) shape of the occupancy
+        '''
+        return np.bincount(self.shape_positions, weights=self.durations(), minlength=int(np.prod(shape))).astype(np.int64).reshape(shape)
+
+    def durations(self):
+        '''
+        This function returns the number of frames in each bout
+        '''
+        return self.end_rows - self.start_rows + 1
+
+    def rows_before(self, rows, num_columns):
+        '''
+        This function returns the number of rows spent in each ROI before each of rows, as a (rows, ROIs) array
+        The bouts are ordered by ROI and row, so with the ROI folded into the row they can be searched as one sorted array
+        '''
+        rows = np.asarray(rows, dtype=np.int64)
+        if not len(self.shape_positions):
+            return np.zeros((len(rows), num_columns), dtype=np.int64)
+        stride = int(max(rows.max(initial=0), self.end_rows.max() + 1)) + 1
+        starts = self.shape_positions * stride + self.start_rows
+        stops = self.shape_positions * stride + self.end_rows + 1
+        queries = np.arange(num_columns) * stride + rows[:, None]
+        completed = np.concatenate(([0], np.cumsum(self.durations())))
+
+        started = np.searchsorted(starts, queries, side='left') #bouts that start before each row
+        stopped = np.searchsorted(stops, queries, side='right') #bouts that are over by each row
+        first_bouts = np.searchsorted(self.shape_positions, np.arange(num_columns)) #first bout of each ROI
+        #the whole bouts that are over plus the part of the bout still going on
+        ongoing = np.where(started > stopped, queries - starts[np.maximum(started - 1, 0)], 0)
+        return completed[stopped] - completed[first_bouts] + ongoing
+
+    def binned_counts(self, edge_rows, shape):
+        '''
+        This function returns the number of rows spent in each ROI between each pair of edge rows, in the (bins, ROIs) or (bins, individuals, ROIs) shape
+        '''
+        return np.diff(self.rows_before(edge_rows, int(np.prod(shape))), axis=0).reshape(-1, *np.atleast_1d(shape))
+
+    def summary(self, shape_names, segment_start_frame, frame_duration):
+        '''
+        This function returns the number of entries, the latency to the first entry and the mean, median and max bout duration in seconds for each ROI
+        The latency and bout durations are NaN for ROIs that were never entered
+        '''
+        durations = self.durations() * frame_duration
+        counts = np.bincount(self.shape_positions, minlength=len(shape_names))
+        summary = {}
+        for i, (name, shape_durations) in enumerate(zip(shape_names, np.split(durations, np.cumsum(counts)[:-1]))):
+            entered = len(shape_durations) > 0
+            first_bout = np.searchsorted(self.shape_positions, i)
+            summary[name] = {
+                'entries': int(counts[i]),
+                'latency': float((self.start_frames[first_bout] - segment_start_frame) * frame_duration) if entered else float('nan'),
+                'mean_bout': float(shape_durations.mean()) if entered else float('nan'),
+                'median_bout': float(np.median(shape_durations)) if entered else float('nan'),
+                'max_bout': float(shape_durations.max()) if entered else float('nan'),
+            }
+        return summary
+
+    def table(self, shape_names, frame_duration):
+        '''
+        This function returns the bout table, a row with the ROI, first frame, last frame and duration in seconds of every bout
+        '''
+        shape_names = list(shape_names)
+        return [{'roi': shape_names[position], 'start_frame': int(start), 'end_frame': int(end), 'duration': float(frame_count * frame_duration)}
+                for position, start, end, frame_count in zip(self.shape_positions.tolist(), self.start_frames.tolist(),
+                                                              self.end_frames.tolist(), self.durations().tolist())]
+
+
+def time_in_shapes(frame_counts, shape_names, frame_duration):
+    '''
+    This function turns the number of frames spent in each ROI into a dictionary of the frames and the time in seconds
+    '''
+    return {name: (int(count), float(count * frame_duration)) for name, count in zip(shape_names, frame_counts)}
+
+
+def time_in_shapes_by_individual(frame_counts, individuals, shape_names, frame_duration):
+    '''
+    This function turns the (individuals, ROIs) number of frames spent in each ROI into a dictionary of time_in_shapes for each individual
+    '''
+    return {individual: time_in_shapes(counts, shape_names, frame_duration) for individual, counts in zip(individuals, frame_counts)}
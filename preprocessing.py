@@ -0,0 +1,366 @@
+import numpy as np
+from scipy.ndimage import correlate1d, median_filter as full_window_median
+from scipy.signal import lfilter, savgol_coeffs
+from tracking import TrackingData, split_body_part
+
+'''
+This file prepares the tracking data before it is scored or measured.
+Points below the likelihood threshold and points that jump further than an animal can move are masked, gaps up to the max gap are filled by interpolation and longer gaps are left missing.
+The positions can then be smoothed to take out the frame to frame jitter of the pose estimates.
+The occupancy, the kinematics and the pathing viewer all see the same positions.
+Masked points hold NaN x and y, which are outside every ROI and skipped by the kinematics.
+'''
+
+MIN_COORDINATE = 1e-5 #coordinates this close to 0 are points DeepLabCut didn't find
+
+
+def preprocessing_key(settings):
+    '''
+    This function returns the settings that change the preprocessed tracking data
+    '''
+    return (settings['min_likelihood'], settings['max_jump'], settings['jump_units'], settings['interpolation'], settings['max_gap_frames'],
+            settings['smoothing'], settings['smoothing_window'])
+
+
+def is_active(settings):
+    '''
+    This function checks if the preprocessing changes the tracking data, with the defaults the data is used as it was loaded
+    '''
+    return settings['min_likelihood'] > 0 or settings['max_jump'] > 0 or settings['interpolation'] != 'off' or settings['smoothing'] != 'off'
+
+
+def needs_every_body_part(settings):
+    '''
+    This function checks if the preprocessing of a body part depends on the other body parts, which is when jumps are measured in body lengths
+    '''
+    return settings['max_jump'] > 0 and settings['jump_units'] == 'body'
+
+
+def context_frames(settings):
+    '''
+    This function returns how many frames before or after a row can change how it is masked and filled,
+    the step a jump is measured over and the run it returns after, then the gap on one side and the slope point past it for cubic
+    '''
+    context = 2 * settings['max_gap_frames'] + 1 if settings['max_jump'] > 0 else 0
+    if settings['interpolation'] == 'cubic':
+        context += 2 * settings['max_gap_frames'] + 1
+    elif settings['interpolation'] == 'linear':
+        context += settings['max_gap_frames']
+    return context
+
+
+def smoothing_rows(settings):
+    '''
+    This function returns how many rows on either side of a row the median and Savitzky-Golay filters use
+    The windows are centred on the row, so an even smoothing window is rounded up to the next odd number of rows
+    '''
+    if settings['smoothing'] in ('median', 'savgol'):
+        return settings['smoothing_window'] // 2
+    return 0
+
+
+def previous_rows(mask):
+    '''
+    This function returns the row of the previous True value in each column for every row of a (frames, body parts) mask, -1 when there is none
+    '''
+    rows = np.arange(len(mask)).reshape((-1,) + (1,) * (mask.ndim - 1))
+    last = np.maximum.accumulate(np.where(mask, rows, -1), axis=0)
+    previous = np.full_like(last, -1)
+    previous[1:] = last[:-1]
+    return previous
+
+
+def next_rows(mask):
+    '''
+    This function returns the row of the next True value in each column for every row of a (frames, body parts) mask, the number of rows when there is none
+    '''
+    return len(mask) - 1 - previous_rows(mask[::-1])[::-1]
+
+
+def fill_gaps(frames, values, valid, max_gap, method='linear'):
+    '''
+    This function fills the rows of each column that aren't valid when the valid rows on either side are at most max_gap frames apart,
+    with 'linear' interpolation or 'cubic' Hermite interpolation whose slopes come from the valid rows around the gap
+    values is a list of (frames, body parts) arrays that are filled the same way, longer gaps are left as they are
+    It returns the filled values and the mask of the rows that were filled
+    '''
+    previous, following = previous_rows(valid), next_rows(valid)
+    #the gap counts the frames missing from the file as well as the rows that aren't valid
+    inside = ~valid & (previous >= 0) & (following < len(valid))
+    rows, columns = np.nonzero(inside)
+    before, after = previous[rows, columns], following[rows, columns]
+    short = frames[after] - frames[before] - 1 <= max_gap
+    rows, columns, before, after = rows[short], columns[short], before[short], after[short]
+    filled = np.zeros(valid.shape, dtype=bool)
+    filled[rows, columns] = True
+
+    #only the rows being filled are worked on, as flat arrays
+    span = (frames[after] - frames[before]).astype(np.float64)
+    t = (frames[rows] - frames[before]) / span
+    if method == 'cubic':
+        #slopes at the ends of the gap from the three point derivative with the valid rows on either side, the slope across the gap where there is none
+        #rows further than a gap away aren't used for the slope, so every fill only depends on the frames close to it
+        outer_before, outer_after = previous[before, columns], following[after, columns]
+        has_outer_before = (outer_before >= 0) & (frames[before] - frames[np.maximum(outer_before, 0)] <= max_gap + 1)
+        has_outer_after = (outer_after < len(valid)) & (frames[np.minimum(outer_after, len(valid) - 1)] - frames[after] <= max_gap + 1)
+        outer_before, outer_after = np.where(has_outer_before, outer_before, before), np.where(has_outer_after, outer_after, after)
+        span_before = np.maximum(frames[before] - frames[outer_before], 1)
+        span_after = np.maximum(frames[outer_after] - frames[after], 1)
+        h00, h10, h01, h11 = 2 * t**3 - 3 * t**2 + 1, t**3 - 2 * t**2 + t, -2 * t**3 + 3 * t**2, t**3 - t**2
+
+    results = []
+    for value in values:
+        start_values, end_values = value[before, columns], value[after, columns]
+        if method == 'cubic':
+            secant = (end_values - start_values) / span
+            secant_before = (start_values - value[outer_before, columns]) / span_before
+            secant_after = (value[outer_after, columns] - end_values) / span_after
+            start_slope = np.where(has_outer_before, (secant * span_before + secant_before * span) / (span_before + span), secant)
+            end_slope = np.where(has_outer_after, (secant_after * span + secant * span_after) / (span + span_after), secant)
+            interpolated = h00 * start_values + h10 * span * start_slope + h01 * end_values + h11 * span * end_slope
+        else:
+            interpolated = start_values + (end_values - start_values) * t
+        value = value.copy()
+        value[rows, columns] = interpolated
+        results.append(value)
+    return results, filled
+
+
+def body_lengths(x, y, valid, body_parts):
+    '''
+    This function returns the diagonal of the box around the valid body parts of each individual in every frame as a (frames, body parts) array,
+    each body part gets the length of its own individual, NaN in frames where the individual has fewer than two valid body parts
+    '''
+    lengths = np.full(x.shape, np.nan)
+    individuals = [split_body_part(body_part)[0] for body_part in body_parts]
+    for individual in dict.fromkeys(individuals):
+        columns = [i for i, owner in enumerate(individuals) if owner == individual]
+        part_valid = valid[:, columns]
+        width = np.max(np.where(part_valid, x[:, columns], -np.inf), axis=1) - np.min(np.where(part_valid, x[:, columns], np.inf), axis=1)
+        height = np.max(np.where(part_valid, y[:, columns], -np.inf), axis=1) - np.min(np.where(part_valid, y[:, columns], np.inf), axis=1)
+        found = np.count_nonzero(part_valid, axis=1) >= 2
+        lengths[:, columns] = np.where(found, np.hypot(np.where(found, width, 0), np.where(found, height, 0)), np.nan)[:, None]
+    return lengths
+
+
+def jump_mask(frames, x, y, valid, settings, body_parts):
+    '''
+    This function flags the valid points that moved further than max_jump per frame from the valid point before them, for every body part at once
+    max_jump is in pixels, or in body lengths of the individual in the smaller of the two frames when jump_units is 'body'
+    Steps are only measured across at most max_gap_frames missing frames, and when a body part jumps back to where it was within max_gap_frames
+    every point from the jump up to the return is flagged, so a short identity swap is masked as a whole
+    '''
+    previous = previous_rows(valid)
+    p = np.maximum(previous, 0)
+    elapsed = frames[:, None] - frames[p]
+    limit = np.full(x.shape, float(settings['max_jump']))
+    if settings['jump_units'] == 'body':
+        lengths = body_lengths(x, y, valid, body_parts)
+        limit *= np.fmin(lengths, np.take_along_axis(lengths, p, axis=0))
+    close = valid & (previous >= 0) & (elapsed <= settings['max_gap_frames'] + 1)
+    distance = np.hypot(x - np.take_along_axis(x, p, axis=0), y - np.take_along_axis(y, p, axis=0))
+    jumps = close & (distance > limit * elapsed)
+
+    #pair each jump with the next jump of the body part when it lands back close to the point before the first one
+    rows, columns = np.nonzero(jumps)
+    if not len(rows):
+        return jumps
+    following = next_rows(jumps)[rows, columns]
+    paired = following < len(frames)
+    rows, columns, following = rows[paired], columns[paired], following[paired]
+    before = p[rows, columns]
+    returns = ((frames[following] - frames[rows] <= settings['max_gap_frames'])
+               & (np.hypot(x[following, columns] - x[before, columns], y[following, columns] - y[before, columns])
+                  <= limit[following, columns] * (frames[following] - frames[before])))
+    rows, columns, following = rows[returns], columns[returns], following[returns]
+    if not len(rows):
+        return jumps
+
+    #the points between a jump and its return are flagged from the running count of the runs that cover them
+    #a body part's jumps are on different rows, so neither the starts nor the returns repeat a (row, column) pair
+    runs = np.zeros((len(frames) + 1, x.shape[1]), dtype=np.int32)
+    runs[rows, columns] += 1
+    runs[following, columns] -= 1
+    returned = np.zeros(x.shape, dtype=bool)
+    returned[following, columns] = True
+    return (np.cumsum(runs[:-1], axis=0) > 0) | (jumps & ~returned)
+
+
+def clean_coords(frames, coords, settings, body_parts=()):
+    '''
+    This function returns a copy of a (frames, body parts, 3) array with the points below the likelihood threshold, not found or jumping masked as NaN
+    and the gaps up to max_gap_frames filled, the likelihood of a filled point is interpolated between the points on either side of its gap
+    '''
+    x, y, likelihood = coords[..., 0], coords[..., 1], coords[..., 2]
+    valid = (np.abs(x) > MIN_COORDINATE) & (np.abs(y) > MIN_COORDINATE) & ~np.isnan(x) & ~np.isnan(y) & (likelihood >= settings['min_likelihood'])
+    if settings['max_jump'] > 0:
+        valid &= ~jump_mask(frames, x, y, valid, settings, body_parts)
+    cleaned = np.array(coords, dtype=np.float32)
+    if settings['interpolation'] != 'off':
+        (x, y, likelihood), filled = fill_gaps(frames, [x, y, likelihood], valid, settings['max_gap_frames'], settings['interpolation'])
+        cleaned[..., 0], cleaned[..., 1], cleaned[..., 2] = x, y, np.clip(likelihood, 0, 1)
+        valid |= filled
+    cleaned[~valid, :2] = np.nan
+    return cleaned
+
+
+def partial_windows(values, half_window):
+    '''
+    This function finds the windows of rows that hold a NaN value or run past the ends of the rows,
+    and returns their row, column and the (window, windows) stack of their values padded with NaN
+    '''
+    window = 2 * half_window + 1
+    partial = correlate1d(np.isnan(values).astype(np.int16), np.ones(window, dtype=np.int16), axis=0, mode='constant', cval=1) > 0
+    rows, columns = np.nonzero(partial)
+    stack = np.full((window, len(rows)), np.nan)
+    for i, offset in enumerate(range(-half_window, half_window + 1)):
+        inside = (rows + offset >= 0) & (rows + offset < len(values))
+        stack[i, inside] = values[rows[inside] + offset, columns[inside]]
+    return rows, columns, stack
+
+
+def median_filter(values, half_window):
+    '''
+    This function returns the median of the values in the window of rows around each row of every column, NaN values are left out of the median
+    '''
+    medians = full_window_median(values, size=(2 * half_window + 1, 1), mode='nearest')
+    #the windows with missing values are sorted on their own, NaN sorts after the values
+    rows, columns, stack = partial_windows(values, half_window)
+    stack.sort(axis=0)
+    count = np.count_nonzero(~np.isnan(stack), axis=0)[None]
+    lower = np.take_along_axis(stack, np.maximum(count - 1, 0) // 2, axis=0)[0]
+    upper = np.take_along_axis(stack, count // 2, axis=0)[0]
+    medians[rows, columns] = (lower + upper) / 2
+    return medians
+
+
+def savgol_filter(values, half_window):
+    '''
+    This function fits a quadratic to the values in the window of rows around each row of every column by least squares and returns its value at the row,
+    the same as a Savitzky-Golay filter but with the NaN values left out of the fit, a window with fewer than three values uses their mean
+    '''
+    window = 2 * half_window + 1
+    if window < 3:
+        return values.copy()
+    fitted = correlate1d(values, savgol_coeffs(window, 2, use='dot'), axis=0, mode='nearest')
+
+    #the windows with missing values are fitted to the values they hold, from the sums of the powers of the row offsets and of the values times the powers
+    rows, columns, stack = partial_windows(values, half_window)
+    offsets = np.arange(-half_window, half_window + 1, dtype=np.float64)[:, None]
+    present = ~np.isnan(stack)
+    stack[~present] = 0
+    s0, s1, s2, s3, s4 = [(present * offsets**power).sum(axis=0) for power in range(5)]
+    t0, t1, t2 = [(stack * offsets**power).sum(axis=0) for power in range(3)]
+
+    #the value at the row is the constant term, from Cramer's rule on the normal equations
+    determinant = s0 * (s2 * s4 - s3 * s3) - s1 * (s1 * s4 - s3 * s2) + s2 * (s1 * s3 - s2 * s2)
+    constant = t0 * (s2 * s4 - s3 * s3) - s1 * (t1 * s4 - s3 * t2) + s2 * (t1 * s3 - s2 * t2)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        #the sums are whole numbers so any window that can be fitted has a determinant of at least 1
+        fitted[rows, columns] = np.where(determinant > 0.5, constant / determinant, t0 / s0)
+    return fitted
+
+
+def exponential_filter(values, alpha, state=None):
+    '''
+    This function runs an exponential moving average down every column, skipping the NaN values, starting each column from the state when it is given
+    It returns the averages and the state, the last average of each column or NaN for columns that had no values yet
+    '''
+    smoothed = np.full(values.shape, np.nan)
+    state = np.full(values.shape[1], np.nan) if state is None else state.copy()
+    for column in range(values.shape[1]):
+        present = ~np.isnan(values[:, column])
+        column_values = values[present, column]
+        if not len(column_values):
+            continue
+        previous = column_values[0] if np.isnan(state[column]) else state[column]
+        averages, _ = lfilter([alpha], [1, alpha - 1], column_values, zi=[(1 - alpha) * previous])
+        smoothed[present, column] = averages
+        state[column] = averages[-1]
+    return smoothed, state
+
+
+def smooth_coords(coords, settings, rows=slice(None), state=None):
+    '''
+    This function smooths the x and y of the rows of a cleaned (frames, body parts, 3) array with the smoothing setting, masked points stay NaN
+    The median and Savitzky-Golay filters use the rows around them, the exponential filter carries on from the state of the rows before
+    It returns the smoothed rows and the state of the exponential filter, a (body parts, 2) array
+    '''
+    smoothed = np.array(coords[rows], dtype=np.float32)
+    if settings['smoothing'] == 'off':
+        return smoothed, state
+    if settings['smoothing'] == 'exponential' and state is None:
+        state = np.full((coords.shape[1], 2), np.nan)
+    missing = np.isnan(smoothed[..., 0])
+    #one body part at a time so the filters only hold the windows of two columns in memory
+    for i in range(coords.shape[1]):
+        positions = coords[:, i, :2].astype(np.float64)
+        if settings['smoothing'] == 'exponential':
+            smoothed[:, i, :2], state[i] = exponential_filter(positions[rows], 2 / (settings['smoothing_window'] + 1), state[i])
+        elif settings['smoothing'] == 'median':
+            smoothed[:, i, :2] = median_filter(positions, smoothing_rows(settings))[rows]
+        else:
+            smoothed[:, i, :2] = savgol_filter(positions, smoothing_rows(settings))[rows]
+    smoothed[missing, :2] = np.nan
+    return smoothed, state
+
+
+def preprocess(tracking, settings):
+    '''
+    This function returns the tracking data after the preprocessing settings, the tracking data itself when they don't change it
+    '''
+    if not is_active(settings):
+        return tracking
+    smoothed, _ = smooth_coords(clean_coords(tracking.frames, tracking.coords, settings, tracking.body_parts), settings)
+    return TrackingData(smoothed, tracking.body_parts, tracking.frames, tracking.file_body_parts)
+
+
+class ChunkPreprocessor:
+    '''
+    This class preprocesses a tracking file a chunk at a time the same way as preprocess does for the whole file
+    The rows near the end of a chunk are held back until the next chunk shows how their gaps end and fills their smoothing window,
+    and the rows before them are kept so gaps and windows across the chunk boundary see both sides
+    '''
+    def __init__(self, settings):
+        self.settings = settings
+        self.context = context_frames(settings)
+        self.half_window = smoothing_rows(settings)
+        self.pending = None #rows carried over to the next chunk, the ones already returned first
+        self.returned_rows = 0 #rows at the start of pending that were already returned
+        self.state = None #exponential filter state after the rows already returned
+
+    def push(self, chunk):
+        '''
+        This function adds the next chunk and returns the preprocessed rows that are ready, which can be none
+        '''
+        if not is_active(self.settings):
+            return chunk
+        data = chunk if self.pending is None else TrackingData(np.concatenate((self.pending.coords, chunk.coords)), chunk.body_parts,
+                                                               np.concatenate((self.pending.frames, chunk.frames)), chunk.file_body_parts)
+        if not len(data):
+            return data
+        cleaned = clean_coords(data.frames, data.coords, self.settings, data.body_parts)
+        #rows closer than the context to the last frame could still be filled from the next chunk, and the rows whose window reaches them smoothed differently
+        cleaned_rows = int(np.searchsorted(data.frames, data.frames[-1] - self.context, side='right')) if self.context else len(data)
+        ready = max(cleaned_rows - self.half_window, self.returned_rows)
+        smoothed, self.state = smooth_coords(cleaned, self.settings, slice(self.returned_rows, ready), self.state)
+        block = TrackingData(smoothed, data.body_parts, data.frames[self.returned_rows:ready], data.file_body_parts)
+
+        if ready < len(data):
+            keep = int(np.searchsorted(data.frames, data.frames[max(ready - self.half_window, 0)] - self.context, side='left'))
+            self.pending = TrackingData(np.array(data.coords[keep:]), data.body_parts, data.frames[keep:], data.file_body_parts)
+            self.returned_rows = ready - keep
+        else:
+            self.pending, self.returned_rows = None, 0
+        return block
+
+    def flush(self):
+        '''
+        This function returns the rows still held back at the end of the file
+        '''
+        if self.pending is None:
+            return None
+        data, returned_rows = self.pending, self.returned_rows
+        self.pending, self.returned_rows = None, 0
+        smoothed, self.state = smooth_coords(clean_coords(data.frames, data.coords, self.settings, data.body_parts), self.settings, slice(returned_rows, None), self.state)
+        return TrackingData(smoothed, data.body_parts, data.frames[returned_rows:], data.file_body_parts)
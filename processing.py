@@ -1,5 +1,4 @@
-import pandas as pd
-from shapely.geometry import Point, Polygon, MultiPolygon
+from shapely.geometry import Polygon, MultiPolygon
 from tkinter import filedialog, messagebox, Toplevel, Listbox, Checkbutton, BooleanVar, StringVar
 from utils import center_window, create_custom_entry
 import tkinter as tk
@@ -10,14 +9,18 @@ import numpy as np
 import matplotlib.pyplot as plt
 from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
 from concurrent.futures import ThreadPoolExecutor
+import occupancy
+import kinematics
+import preprocessing
+from roi_index import get_roi_index, shapes_key
+from loader import load_tracking
+from tracking import frame_coverage, format_coverage
 
 '''
 Add a way to plot only points that appear within a specific region of interest
 
 
-5 minute video takes 50.7 seconds to process
-
-5 minute to 
+5 minute video took 50.7 seconds to process with the frame by frame loop, the occupancy module now tests whole segments at once
 
 '''
 
@@ -29,6 +32,14 @@ class DataProcessor:
     def __init__(self, app):
         self.app = app
         self.file_path = None
+        self.tracking = None #tracking data of the file after the preprocessing settings
+        self.tracking_key = None #the file and preprocessing settings the tracking data was prepared with
+        self.membership = None #bit packed membership of every frame in the file
+        self.membership_key = None #the file, ROIs and containment settings the membership was built with
+        self.occupancy_index = None #prefix sums of the whole file's occupancy
+        self.occupancy_key = None #the membership and scoring options the occupancy index was built with
+        self.individual_index = None #prefix sums of each individual's occupancy for multi animal files
+        self.kinematics = {} #kinematics of recent segments keyed on the file, segment, likelihood threshold and outlier settings
     
     #function to get correct bodypart dictionary
     @staticmethod
@@ -53,20 +64,18 @@ class DataProcessor:
     #this if a function to open the csv or h5 file containing the tracking data
     def open_file(self):
         #open the filedialog for csv and h5 files
-        file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv"), ("HDF5 files", "*.h5")])
+        file_path = filedialog.askopenfilename(filetypes=[("CSV files", "*.csv"), ("HDF5 files", "*.h5 *.hdf5")])
         #check if the file selected is a csv of h5
         if file_path:
-            file_extension = os.path.splitext(file_path)[1]
-            if file_extension == '.csv': #if csv read the data accordingly from deeplabcut csv
-                new_data = pd.read_csv(file_path, header=[0, 1, 2])
-            elif file_extension == '.h5': #if a h5 read accordingly with the hdf5 key
-                new_data = pd.read_hdf(file_path, key='/df_with_missing') 
-            else: #show message box error if other file type is selected
+            #read the file into the float32 tracking tensor
+            try:
+                tracking = load_tracking(file_path)
+            except ValueError: #show message box error if other file type is selected
                 self.app.custom_messagebox("Error", "Unsupported file type.", "#19232D", "white")
                 return
             
-            #find the set of body parts
-            new_body_parts = set(new_data.columns.get_level_values(1))
+            #find the body parts
+            new_body_parts = set(tracking.body_parts)
 
             #use static methods to apply exlusions
             self.app.excluded_body_parts = DataProcessor.compare_and_apply_exclusions(
@@ -74,15 +83,17 @@ class DataProcessor:
             )
 
             #load the new data and body parts
-            self.app.data = new_data
-            self.app.body_parts = new_body_parts
+            self.app.tracking = tracking
+            self.tracking_key = None #the cached tracking data and membership belong to the old file
+            self.membership_key = None
+            self.occupancy_key = None
+            self.kinematics.clear()
             self.app.csv_loaded = True #change csv status to True
             self.app.start_button.config(state=tk.NORMAL) #allow the process button the be pressed
             self.app.load_csv_label.config(text=f"File: \n{os.path.basename(file_path)} loaded") #display the file name
             
-            #find the body parts set from the data frame
-            body_parts_columns = [(col[0], col[1]) for col in self.app.data.columns if col[2] in ['x', 'y']]
-            self.app.body_parts = sorted(set(col[1] for col in body_parts_columns))
+            #sorted body parts for the listboxes
+            self.app.body_parts = sorted(new_body_parts)
             self.app.update_body_part_label([bp for bp in self.app.body_parts if bp not in self.app.excluded_body_parts]) #update body parts label
 
             #store the file path
@@ -99,26 +110,22 @@ class DataProcessor:
             self.app.custom_messagebox("File Loaded", f"Successfully loaded file: {os.path.basename(file_path)}", bg_color='#19232D', fg_color='white')
     
     
-    def find_columns(self, body_part):
+    def get_tracking(self):
         '''
-        This function finds the columns for the x coordinate y coordinate and liklihood
+        This function returns the tracking data after the preprocessing settings, only masking and filling the gaps again when the file or settings change
         '''
-        columns = self.app.data.columns
-        x_col, y_col, likelihood_col = None, None, None
+        key = (self.file_path, preprocessing.preprocessing_key(self.app.settings))
+        if key != self.tracking_key:
+            self.tracking = preprocessing.preprocess(self.app.tracking, self.app.settings)
+            self.tracking_key = key
+        return self.tracking
 
-        for col in columns:
-            if col[1] == body_part:
-                if col[2] == 'x':
-                    x_col = col
-                elif col[2] == 'y':
-                    y_col = col
-                elif col[2] == 'likelihood':
-                    likelihood_col = col
-
-        if x_col and y_col and likelihood_col:
-            return x_col, y_col, likelihood_col
-        else:
-            raise ValueError(f"Could not find columns for body part: {body_part}")
+    def get_kinematics(self, min_likelihood):
+        '''
+        This function returns the kinematics of every body part in the selected segment, reusing them while the file, segment, thresholds and settings stay the same
+        '''
+        return kinematics.cached_kinematics(self.kinematics, self.get_tracking(), int(self.app.start_frame), int(self.app.end_frame),
+                                            self.app.fps, min_likelihood, self.app.settings, self.file_path)
 
     def scale_coordinates(self, x, y):
         '''
@@ -130,18 +137,13 @@ class DataProcessor:
 
     def verify_frames(self):
         '''
-        This function verifies if all the frames in the video exist in the dataframe
+        This function verifies if all the frames in the video exist in the tracking data and logs a summary of any gaps or duplicates
         '''
-        csv_frames = self.app.data.index.tolist()
-        missing_frames = [frame_index for frame_index in range(self.app.total_frames) if frame_index not in csv_frames]
-        if missing_frames:
-            print(f"Missing frames in file: {missing_frames}")
-            if self.app.log_file:
-                self.app.log_file.write(f"Missing frames in file: {missing_frames}\n")
-        else:
-            print("All frames are present in the file.")
-            if self.app.log_file:
-                self.app.log_file.write("All frames are present in the file.\n")
+        summary = format_coverage(frame_coverage(self.app.tracking.frames, self.app.total_frames))
+        print(summary)
+        if self.app.log_file:
+            self.app.log_file.write(summary + "\n")
+            self.app.log_file.flush()
 
     def check_body_parts_in_shapes(self):
         '''
@@ -161,66 +163,99 @@ class DataProcessor:
         start_frame = int(self.app.start_frame)
         end_frame = int(self.app.end_frame)
         
-        #initialize and immediately update the progress bar
-        total_frames = end_frame - start_frame + 1
-        self.app.progress_bar(total_frames)
-        self.app.update_progress(0)  #force the progress bar to show up immediately
-        
-        #create dictionary to store frames that appear within the shapes 
-        frames_in_shapes = {name: set() for name in self.app.shape_drawer.shapes}
-        
-        #extract relevant columns
-        body_parts_columns = [(col[0], col[1], col[2]) for col in self.app.data.columns if col[2] in ['x', 'y']]
-        num_body_parts = len(set(col[1] for col in body_parts_columns))
-        
-        #vectorized check for each frame within the selected segment
-        for index in range(start_frame, end_frame + 1):
-            #scale coordinates on demand for the current frame
-            row_scaled_coords = {col: self.scale_coordinates(self.app.data.at[index, (col[0], col[1], 'x')], 
-                                                             self.app.data.at[index, (col[0], col[1], 'y')])
-                                 for col in body_parts_columns}
-            
-            for shape_name, polygon in self.app.shape_drawer.shapes.items():
-                in_shape_count = 0
-                specific_part_in_shape = False
-                any_part_in_shape = False
-    
-                for col, (scaled_x, scaled_y) in row_scaled_coords.items():
-                    if col[1] in self.app.excluded_body_parts:
-                        continue
-    
-                    point = Point(scaled_x, scaled_y)
-    
-                    if polygon.contains(point):
-                        in_shape_count += 1
-                        if self.app.track_mode == 'specific' and col[1] == self.app.specific_body_part:
-                            specific_part_in_shape = True
-                            break  #early exit if specific body part is found
-                        if self.app.track_mode == 'any_part' and self.app.data.at[index, (col[0], col[1], 'likelihood')] >= 0.99:
-                            any_part_in_shape = True
-                            break  #early exit if any part with high likelihood is found
-    
-                #update frames in shapes based on the tracking mode
-                if self.app.track_mode == 'specific' and specific_part_in_shape:
-                    frames_in_shapes[shape_name].add(index)
-                elif self.app.track_mode == 'majority' and in_shape_count >= self.app.percent * num_body_parts:
-                    frames_in_shapes[shape_name].add(index)
-                elif self.app.track_mode == 'any_part' and any_part_in_shape:
-                    frames_in_shapes[shape_name].add(index)
-    
-            #progress bar updates
-            if (index - start_frame) % 50 == 0:
-                self.app.update_progress(index - start_frame + 1)
+        #number of frames spent in each ROI from the prefix sums of the whole file
+        occupancy_index, individual_index = self.get_occupancy_index()
+        frame_counts = occupancy_index.counts(start_frame, end_frame)
     
         #calculate and display the total time spent in each shape
-        for shape_name, frames in frames_in_shapes.items():
-            total_time_in_shape = len(frames) * self.app.frame_duration
+        for shape_name, (frame_count, total_time_in_shape) in occupancy.time_in_shapes(frame_counts, self.app.shape_drawer.shapes.keys(), self.app.frame_duration).items():
             self.app.shape_drawer.time_counters[shape_name] = total_time_in_shape
-            print(f"Total frames in shape '{shape_name}': {len(frames)}")
+            print(f"Total frames in shape '{shape_name}': {frame_count}")
             print(f"Total time in shape '{shape_name}': {total_time_in_shape:.2f} seconds")
+        
+        #run length encode the occupancy of the segment to find the entries and bouts in each shape
+        bouts = occupancy_index.bouts(start_frame, end_frame)
+        self.app.shape_drawer.bout_stats = bouts.summary(self.app.shape_drawer.shapes.keys(), start_frame, self.app.frame_duration)
+        for shape_name, stats in self.app.shape_drawer.bout_stats.items():
+            print(f"Entries into shape '{shape_name}': {stats['entries']}, latency: {stats['latency']:.2f} seconds, "
+                  f"bouts mean/median/max: {stats['mean_bout']:.2f}/{stats['median_bout']:.2f}/{stats['max_bout']:.2f} seconds")
+        if self.app.log_file:
+            self.app.log_file.write("Bouts (roi, start frame, end frame, duration):\n")
+            self.app.log_file.writelines(f"{bout['roi']}, {bout['start_frame']}, {bout['end_frame']}, {bout['duration']:.2f}\n"
+                                         for bout in bouts.table(self.app.shape_drawer.shapes.keys(), self.app.frame_duration))
+            self.app.log_file.flush()
+        
+        #split the segment into time bins from the same prefix sums
+        bin_frames = occupancy.frames_per_bin(self.app.settings['bin_seconds'], 1.0 / self.app.frame_duration)
+        if bin_frames:
+            edges = occupancy.bin_edges(start_frame, end_frame, bin_frames)
+            shape_names = list(self.app.shape_drawer.shapes.keys())
+            lines = [f"{edges[i]}, {edges[i + 1] - 1}, " + ", ".join(f"{count * self.app.frame_duration:.2f}" for count in counts)
+                     for i, counts in enumerate(occupancy_index.binned_counts(start_frame, end_frame, bin_frames))]
+            print(f"Time in shapes per {self.app.settings['bin_seconds']:g} second bin (start frame, end frame, {', '.join(shape_names)}):\n" + "\n".join(lines))
+            if self.app.log_file:
+                self.app.log_file.write(f"Time bins (start frame, end frame, {', '.join(shape_names)}):\n")
+                self.app.log_file.writelines(line + "\n" for line in lines)
+                self.app.log_file.flush()
+        
+        #multi animal files also get the time each individual spent in each shape
+        self.app.shape_drawer.individual_time_counters.clear()
+        if individual_index:
+            individual_times = occupancy.time_in_shapes_by_individual(individual_index.counts(start_frame, end_frame), self.app.tracking.individuals,
+                                                                      self.app.shape_drawer.shapes.keys(), self.app.frame_duration)
+            for individual, times in individual_times.items():
+                self.app.shape_drawer.individual_time_counters[individual] = {shape_name: total_time for shape_name, (_, total_time) in times.items()}
+                print(f"Time in shapes for '{individual}': " + ", ".join(f"{shape_name}: {total_time:.2f} seconds" for shape_name, (_, total_time) in times.items()))
     
         self.app.update_time_labels()
+    
+    def get_membership(self):
+        '''
+        This function returns the cached membership of every frame in the file, only running the polygon tests again when the file, ROIs, containment or preprocessing settings change
+        '''
+        shapes = self.app.shape_drawer.shapes
+        tracking = self.get_tracking()
+        video_size = (self.app.video_width, self.app.video_height)
+        key = (self.file_path, (int(tracking.frames[0]), int(tracking.frames[-1])), shapes_key(shapes), video_size,
+               self.app.settings['containment'], self.app.settings['raster_tolerance'], self.app.settings['hysteresis'],
+               preprocessing.preprocessing_key(self.app.settings))
+        if key == self.membership_key:
+            return self.membership, key
+        
+        #initialize and immediately update the progress bar, it advances once per block of frames
+        self.app.progress_bar(occupancy.num_chunks(len(tracking)))
+        self.app.update_progress(0)  #force the progress bar to show up immediately
+        
+        #batched point in polygon tests for every body part in every frame of the file, a block of frames at a time
+        self.membership = occupancy.packed_points_membership(tracking.coords, shapes, video_size, self.app.settings, progress=self.app.update_progress)
+        self.membership_key = key
+        
         self.app.close_progress_bar()
+        return self.membership, key
+    
+    def get_occupancy_index(self):
+        '''
+        This function returns the prefix sums of the occupancy for every frame in the file, and of each individual's occupancy for multi animal files (None otherwise)
+        Changing the mode, percent, exclusions or debouncing only re-scores the cached membership
+        '''
+        membership, membership_key = self.get_membership()
+        debounce = occupancy.debounce_frames(self.app.settings['min_bout'], self.app.settings['min_gap'], 1.0 / self.app.frame_duration)
+        key = (membership_key, self.app.track_mode, self.app.percent, frozenset(self.app.excluded_body_parts), self.app.specific_body_part, debounce)
+        if key == self.occupancy_key:
+            return self.occupancy_index, self.individual_index
+        
+        tracking = self.get_tracking()
+        scoring = (self.app.track_mode, self.app.percent, self.app.excluded_body_parts, self.app.specific_body_part)
+        likelihood = tracking.coords[..., 2]
+        in_shapes = membership.reduce(likelihood, tracking.body_parts, *scoring, tracking.total_body_parts)
+        self.occupancy_index = occupancy.OccupancyIndex(occupancy.debounce_occupancy(in_shapes, *debounce), tracking.frames)
+        self.individual_index = None
+        if tracking.individuals:
+            #every individual is scored at once along an extra axis of the occupancy
+            in_shapes_by_individual = membership.reduce_individuals(likelihood, tracking.body_parts, *scoring, tracking.file_body_parts)
+            self.individual_index = occupancy.OccupancyIndex(occupancy.debounce_occupancy(in_shapes_by_individual, *debounce), tracking.frames)
+        self.occupancy_key = key
+        return self.occupancy_index, self.individual_index
         
     def create_pathing_slideshow(self):
         current_frame_index = self.app.start_frame
@@ -320,6 +355,7 @@ class DataProcessor:
             return
     
         path_points_dict = {body_part: [] for body_part in self.app.specific_body_parts}
+        tracking = self.get_tracking()
     
         #create and center the window before entering the loop
         cv2.namedWindow('Tracking Overlay Viewer', cv2.WINDOW_NORMAL)
@@ -345,13 +381,16 @@ class DataProcessor:
             #resize frame based on scaling factor
             frame = cv2.resize(frame, (new_width, new_height))
     
+            #x, y and likelihood of every body part in the current frame, after the same preprocessing as the occupancy
+            frame_coords = tracking.coords[tracking.row(current_frame_index)]
+    
             for body_part in self.app.specific_body_parts:
-                x_col, y_col, likelihood_col = self.find_columns(body_part)
-                x = self.app.data.loc[current_frame_index, x_col] * scaling_factor
-                y = self.app.data.loc[current_frame_index, y_col] * scaling_factor
-                likelihood = self.app.data.loc[current_frame_index, likelihood_col]
+                x, y, likelihood = frame_coords[tracking.part_index[body_part]]
+                x = x * scaling_factor
+                y = y * scaling_factor
     
-                if likelihood > 0.9:
+                #masked points are NaN and aren't drawn
+                if likelihood > 0.9 and not np.isnan(x):
                     point = (int(x), int(y))
                     path_points = path_points_dict[body_part]
                     path_points.append(point)
@@ -426,44 +465,20 @@ class DataProcessor:
         '''
         This function processes the body part that will be plotted and allows the user to select options for how the plot would be displayed
         '''
-        x_col, y_col, likelihood_col = self.find_columns(body_part)
-        
-        filtered_df = self.app.data.loc[
-            (self.app.data.index >= self.app.start_frame) & (self.app.data.index <= self.app.end_frame) &
-            (self.app.data[x_col].abs() > 1e-5) & (self.app.data[y_col].abs() > 1e-5) &
-            (~self.app.data[x_col].isna()) & (~self.app.data[y_col].isna()) &
-            (pd.notna(self.app.data[x_col])) & (pd.notna(self.app.data[y_col])) &
-            (self.app.data[likelihood_col] >= .99)
-        ]
-        
-        Q1_x = filtered_df[x_col].quantile(0.25)
-        Q3_x = filtered_df[x_col].quantile(0.75)
-        IQR_x = Q3_x - Q1_x
+        #positions without the outliers and the path length from the shared kinematics
+        motion = self.get_kinematics(kinematics.PATH_LIKELIHOOD)
+        x_values, y_values = motion.positions(body_part)
+        path_length = motion.path_length(body_part)
         
-        Q1_y = filtered_df[y_col].quantile(0.25)
-        Q3_y = filtered_df[y_col].quantile(0.75)
-        IQR_y = Q3_y - Q1_y
+        sorted_order = np.argsort(x_values, kind='stable')
         
-        lower_bound_x = Q1_x - 1.5 * IQR_x
-        upper_bound_x = Q3_x + 1.5 * IQR_x
-        
-        lower_bound_y = Q1_y - 1.5 * IQR_y
-        upper_bound_y = Q3_y + 1.5 * IQR_y
-        
-        non_outliers_df = filtered_df[(filtered_df[x_col] >= lower_bound_x) & (filtered_df[x_col] <= upper_bound_x) &
-                                      (filtered_df[y_col] >= lower_bound_y) & (filtered_df[y_col] <= upper_bound_y)]
-        
-        sorted_df = non_outliers_df.sort_values(by=x_col)
-        
-        x_min = non_outliers_df[x_col].min()
-        x_max = non_outliers_df[x_col].max()
-        y_min = non_outliers_df[y_col].min()
-        y_max = non_outliers_df[y_col].max()
+        x_min = x_values.min()
+        x_max = x_values.max()
+        y_min = y_values.min()
+        y_max = y_values.max()
         bounding_box_area = (x_max - x_min) * (y_max - y_min)
         
-        auc = np.trapz(sorted_df[y_col], sorted_df[x_col])
-        
-        path_length = np.sum(np.sqrt(np.diff(non_outliers_df[x_col])**2 + np.diff(non_outliers_df[y_col])**2))
+        auc = np.trapz(y_values[sorted_order], x_values[sorted_order])
         
         display_options_popup = Toplevel(self.app.root, bg='#19232D')
         display_options_popup.title("Display Options")
@@ -524,7 +539,7 @@ class DataProcessor:
                 frame_rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
                 ax.imshow(frame_rgb)
         
-            ax.plot(non_outliers_df[x_col], non_outliers_df[y_col], marker='o', linestyle='-', color='b', alpha=0.7, label=f'{body_part} Movement')
+            ax.plot(x_values, y_values, marker='o', linestyle='-', color='b', alpha=0.7, label=f'{body_part} Movement')
         
             bounding_box_length = x_max - x_min
             bounding_box_width = y_max - y_min
@@ -539,20 +554,23 @@ class DataProcessor:
             if show_roi_var.get():
                 selected_rois = [roi_listbox.get(i) for i in roi_listbox.curselection()]
                 scaled_shapes = self.app.shape_drawer.scale_coordinates(self.app.shape_drawer.shapes)
+                #find the share of the plotted points inside each ROI using the index of the scaled ROIs
+                fraction_inside = get_roi_index(scaled_shapes).fraction_inside(x_values, y_values)
                 for name in selected_rois:
                     polygon = scaled_shapes[name]
+                    roi_label = f'ROI: {name} ({fraction_inside[name] * 100:.1f}% of points)'
                     if isinstance(polygon, Polygon):
                         x, y = polygon.exterior.xy
-                        ax.plot(x, y, linestyle='solid', linewidth=2, label=f'ROI: {name}')
+                        ax.plot(x, y, linestyle='solid', linewidth=2, label=roi_label)
                         ax.fill(x, y, alpha=0.2)
                     elif isinstance(polygon, MultiPolygon):
                         for sub_polygon in polygon.geoms:
                             x, y = sub_polygon.exterior.xy
-                            ax.plot(x, y, linestyle='solid', linewidth=2, label=f'ROI: {name}')
+                            ax.plot(x, y, linestyle='solid', linewidth=2, label=roi_label)
                             ax.fill(x, y, alpha=0.2)
         
             if show_auc_var.get():
-                ax.fill_between(non_outliers_df[x_col], non_outliers_df[y_col], alpha=0.3, label=f'AUC: {auc:.2f}')
+                ax.fill_between(x_values, y_values, alpha=0.3, label=f'AUC: {auc:.2f}')
         
             if square_graph_var.get():
                 ax.set_aspect('equal', 'box')
@@ -567,12 +585,10 @@ class DataProcessor:
                     ax.set_ylim([center_y - zoom_radius, center_y + zoom_radius])
                     ax.invert_yaxis()
                     
-                    non_outliers_df_zoomed = non_outliers_df[
-                        (non_outliers_df[x_col] >= center_x - zoom_radius) & (non_outliers_df[x_col] <= center_x + zoom_radius) &
-                        (non_outliers_df[y_col] >= center_y - zoom_radius) & (non_outliers_df[y_col] <= center_y + zoom_radius)
-                    ]
+                    zoomed = ((x_values >= center_x - zoom_radius) & (x_values <= center_x + zoom_radius) &
+                              (y_values >= center_y - zoom_radius) & (y_values <= center_y + zoom_radius))
                     
-                    ax.plot(non_outliers_df_zoomed[x_col], non_outliers_df_zoomed[y_col], marker='o', linestyle='-', color='b', alpha=0.7, label=f'{body_part} Movement')
+                    ax.plot(x_values[zoomed], y_values[zoomed], marker='o', linestyle='-', color='b', alpha=0.7, label=f'{body_part} Movement')
                     
                 except ValueError:
                     self.app.custom_messagebox("Error", "Invalid zoom radius. Please enter a numeric value.", "#19232D", "white")
@@ -637,44 +653,13 @@ class DataProcessor:
         
         
     def process_speed(self, body_part):
-        #reuse the filtering logic from process_body_part
-        x_col, y_col, likelihood_col = self.find_columns(body_part)
-        
-        filtered_df = self.app.data.loc[
-            (self.app.data.index >= self.app.start_frame) & (self.app.data.index <= self.app.end_frame) &
-            (self.app.data[x_col].abs() > 1e-5) & (self.app.data[y_col].abs() > 1e-5) &
-            (~self.app.data[x_col].isna()) & (~self.app.data[y_col].isna()) &
-            (pd.notna(self.app.data[x_col])) & (pd.notna(self.app.data[y_col])) &
-            (self.app.data[likelihood_col] >= 0.75)
-        ]
-        
-        #calculate speed
-        x_coords = filtered_df[x_col].values
-        y_coords = filtered_df[y_col].values
-        
-        dx = np.diff(x_coords)
-        dy = np.diff(y_coords)
-        
-        distances = np.sqrt(dx**2 + dy**2)
-        
-        time_interval = 1 / self.app.fps
-        
-        speed = distances / time_interval
-        
-        #remove outliers using the IQR method
-        Q1 = np.percentile(speed, 25)
-        Q3 = np.percentile(speed, 75)
-        IQR = Q3 - Q1
-        
-        lower_bound = Q1 - 1.5 * IQR
-        upper_bound = Q3 + 1.5 * IQR
-        
-        #filter speeds that are within the IQR bounds
-        valid_indices = (speed >= lower_bound) & (speed <= upper_bound)
-        speed = speed[valid_indices]
-        time_axis = np.arange(len(speed)) / self.app.fps
+        #speed from the shared kinematics at the time of each frame it was measured on
+        motion = self.get_kinematics(kinematics.SPEED_LIKELIHOOD)
+        speed = motion.speed(body_part)
+        time_axis = motion.times(body_part)
+        speed_per_frame = motion.frame_speeds(body_part, int(self.app.end_frame))
         
-        average_speed = np.mean(speed)
+        average_speed = motion.mean_speed(body_part)
         
         #create the display options popup
         display_options_popup = Toplevel(self.app.root, bg='#19232D')
@@ -690,8 +675,9 @@ class DataProcessor:
         show_max_speed_var = BooleanVar(value=True)
         show_avg_speed_var = BooleanVar(value=True)
         
-        #create string variable to hold the segment length
+        #create string variables to hold the segment length and the number of fastest and slowest segments
         segment_length_var = StringVar(value="30")
+        segment_count_var = StringVar(value="1")
         
         #create custom checkboxes and custom entry box
         create_custom_checkbutton(display_options_popup, "Show Max Speed", show_max_speed_var).pack(pady=5)
@@ -699,51 +685,47 @@ class DataProcessor:
         create_custom_checkbutton(display_options_popup, "Show Fastest Segment", show_fastest_segment_var).pack(pady=5)
         create_custom_checkbutton(display_options_popup, "Show Slowest Segment", show_slowest_segment_var).pack(pady=5)
         create_custom_entry(display_options_popup, "Segment Length (seconds):", segment_length_var).pack(pady=5)
+        create_custom_entry(display_options_popup, "Number of Segments:", segment_count_var).pack(pady=5)
         
         def on_apply():
-            #retrieve the segment length from the entry box
+            #retrieve the segment length and number of segments from the entry boxes
             try:
                 window_size = int(segment_length_var.get())  #convert to integer
+                segment_count = int(segment_count_var.get())
             except ValueError:
-                self.app.custom_messagebox("Error", "Please enter a valid integer for segment length.", "#19232D", "white")
+                self.app.custom_messagebox("Error", "Please enter a valid integer for segment length and number of segments.", "#19232D", "white")
                 return
             
-            num_frames = len(speed)
             window_length = int(window_size * self.app.fps)
+            if window_length < 1 or window_length > len(speed_per_frame) or segment_count < 1:
+                self.app.custom_messagebox("Error", "The segment length has to fit in the selected segment and at least one segment has to be shown.", "#19232D", "white")
+                return
             
-            max_avg_speed = float('-inf')
-            min_avg_speed = float('inf')
-            max_start = 0
-            min_start = 0
-            
-            for i in range(num_frames - window_length + 1):
-                window_avg_speed = np.mean(speed[i:i + window_length])
-                
-                if window_avg_speed > max_avg_speed:
-                    max_avg_speed = window_avg_speed
-                    max_start = i
-                
-                if window_avg_speed < min_avg_speed:
-                    min_avg_speed = window_avg_speed
-                    min_start = i
+            #the mean of every window of frames comes from cumulative sums, the segments picked don't overlap
+            fastest = kinematics.extreme_windows(speed_per_frame, window_length, segment_count, fastest=True)
+            slowest = kinematics.extreme_windows(speed_per_frame, window_length, segment_count, fastest=False)
             
             max_speed = np.max(speed)
-            max_speed_frame = np.argmax(speed)
+            max_speed_time = time_axis[np.argmax(speed)]
             
             #print the results in seconds
-            print(f'Fastest segment: Time {max_start/self.app.fps:.2f} to {(max_start + window_length)/self.app.fps:.2f} seconds with average speed {max_avg_speed:.2f} pix/second')
-            print(f'Slowest segment: Time {min_start/self.app.fps:.2f} to {(min_start + window_length)/self.app.fps:.2f} seconds with average speed {min_avg_speed:.2f} pix/second')
-            print(f'Maximum speed: {max_speed:.2f} pix/second at time {max_speed_frame/self.app.fps:.2f} seconds')
+            for rank, (start, avg_speed) in enumerate(fastest, 1):
+                print(f'Fastest segment {rank}: Time {start/self.app.fps:.2f} to {(start + window_length)/self.app.fps:.2f} seconds with average speed {avg_speed:.2f} pix/second')
+            for rank, (start, avg_speed) in enumerate(slowest, 1):
+                print(f'Slowest segment {rank}: Time {start/self.app.fps:.2f} to {(start + window_length)/self.app.fps:.2f} seconds with average speed {avg_speed:.2f} pix/second')
+            print(f'Maximum speed: {max_speed:.2f} pix/second at time {max_speed_time:.2f} seconds')
             
             #plot the speed over time in seconds
             fig = plt.figure(figsize=(10, 6))
             plt.plot(time_axis, speed, label=f'Speed of {body_part.capitalize()}')
             
             if show_fastest_segment_var.get():
-                plt.axvspan(max_start / self.app.fps, (max_start + window_length) / self.app.fps, color='red', alpha=0.3, label='Fastest Segment')
+                for rank, (start, _) in enumerate(fastest):
+                    plt.axvspan(start / self.app.fps, (start + window_length) / self.app.fps, color='red', alpha=0.3, label='Fastest Segment' if rank == 0 else None)
         
             if show_slowest_segment_var.get():
-                plt.axvspan(min_start / self.app.fps, (min_start + window_length) / self.app.fps, color='blue', alpha=0.3, label='Slowest Segment')
+                for rank, (start, _) in enumerate(slowest):
+                    plt.axvspan(start / self.app.fps, (start + window_length) / self.app.fps, color='blue', alpha=0.3, label='Slowest Segment' if rank == 0 else None)
                 
             if show_avg_speed_var.get():
                 plt.axhline(average_speed, color='blue', linestyle='--', label=f'Average Speed: {average_speed:.2f} pix/second')
@@ -753,7 +735,7 @@ class DataProcessor:
             
             plt.xlabel('Time (seconds)')
             plt.ylabel('Speed (pix/second)')
-            plt.title(f'Speed of {body_part.capitalize()} Over Time (Outliers Removed)')
+            plt.title(f'Speed of {body_part.capitalize()} Over Time')
             plt.legend()
             plt.show()
             
@@ -803,45 +785,10 @@ class DataProcessor:
         '''
         This function processes a specific body part to determine the velocity in the x and y direction over time and plot the data
         '''
-        #reuse the filtering logic from process_body_part
-        x_col, y_col, likelihood_col = self.find_columns(body_part)
-        
-        filtered_df = self.app.data.loc[
-            (self.app.data.index >= self.app.start_frame) & (self.app.data.index <= self.app.end_frame) &
-            (self.app.data[x_col].abs() > 1e-5) & (self.app.data[y_col].abs() > 1e-5) &
-            (~self.app.data[x_col].isna()) & (~self.app.data[y_col].isna()) &
-            (pd.notna(self.app.data[x_col])) & (pd.notna(self.app.data[y_col])) &
-            (self.app.data[likelihood_col] >= 0.75)
-        ]
-        
-        #valculate velocity
-        x_coords = filtered_df[x_col].values
-        y_coords = filtered_df[y_col].values
-        
-        dx = np.diff(x_coords)
-        dy = np.diff(y_coords)
-        
-        time_interval = 1 / self.app.fps
-        
-        vx = dx / time_interval  #velocity in the x-direction
-        vy = dy / time_interval  #velocity in the y-direction
-        
-        #calculate speed
-        speed = np.sqrt(vx**2 + vy**2)
-        
-        #remove outliers using the IQR method
-        Q1 = np.percentile(speed, 25)
-        Q3 = np.percentile(speed, 75)
-        IQR = Q3 - Q1
-        
-        lower_bound = Q1 - 1.5 * IQR
-        upper_bound = Q3 + 1.5 * IQR
-        
-        #filter velocities that are within the IQR bounds
-        valid_indices = (speed >= lower_bound) & (speed <= upper_bound)
-        vx_filtered = vx[valid_indices]
-        vy_filtered = vy[valid_indices]
-        time_axis = np.arange(len(vx_filtered)) / self.app.fps
+        #velocity in the x and y direction from the shared kinematics at the time of each frame it was measured on
+        motion = self.get_kinematics(kinematics.SPEED_LIKELIHOOD)
+        vx_filtered, vy_filtered = motion.velocity(body_part)
+        time_axis = motion.times(body_part)
         
         #calculate average velocities in positive and negative directions
         avg_vx_positive = np.mean(vx_filtered[vx_filtered > 0]) if np.any(vx_filtered > 0) else 0
@@ -919,7 +866,7 @@ class DataProcessor:
             
             plt.xlabel('Time (seconds)')
             plt.ylabel('Velocity (pixels/second)')
-            plt.title(f'Velocity Components for {body_part.capitalize()} Over Time (Outliers Removed)')
+            plt.title(f'Velocity Components for {body_part.capitalize()} Over Time')
             plt.legend()
             plt.show()
             
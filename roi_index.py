@@ -0,0 +1,76 @@
+import numpy as np
+import shapely
+
+'''
+This file contains the index over the regions of interest that limits the polygon tests to the points that fall inside each ROI's bounding box.
+'''
+
+
+def shapes_key(shapes):
+    '''
+    This function returns a hashable key that changes whenever the names or geometry of the ROIs change
+    '''
+    return tuple((name, polygon.wkb) for name, polygon in shapes.items())
+
+
+class RoiIndex:
+    '''
+    This class holds prepared geometries and bounding boxes for a set of ROIs so each point is only tested against the ROIs whose bounds contain it
+    '''
+    def __init__(self, shapes):
+        self.names = list(shapes.keys())
+        self.geometries = list(shapes.values())
+        shapely.prepare(self.geometries) #prepare once, every later test reuses it
+        self.bounds = shapely.bounds(self.geometries) #(ROIs, 4) array of min x, min y, max x, max y
+
+    def __len__(self):
+        return len(self.names)
+
+    def contains(self, x, y, progress=None):
+        '''
+        This function classifies every point against every ROI and returns a boolean array of shape x.shape + (ROIs,)
+        '''
+        flat_x = np.ravel(x)
+        flat_y = np.ravel(y)
+        membership = np.zeros((flat_x.size, len(self)), dtype=bool)
+
+        #sort the points by x once so the candidates for each ROI are one contiguous interval, missing points sort to the end
+        order = np.argsort(flat_x, kind='stable')
+        sorted_x = flat_x[order]
+
+        for i, (polygon, (min_x, min_y, max_x, max_y)) in enumerate(zip(self.geometries, self.bounds)):
+            start = np.searchsorted(sorted_x, min_x, side='left')
+            end = np.searchsorted(sorted_x, max_x, side='right')
+            candidates = order[start:end]
+
+            #narrow the interval down to the bounding box before the polygon test
+            candidate_y = flat_y[candidates]
+            candidates = candidates[(candidate_y >= min_y) & (candidate_y <= max_y)]
+            membership[candidates, i] = shapely.contains_xy(polygon, flat_x[candidates], flat_y[candidates])
+            if progress:
+                progress(i + 1)
+
+        return membership.reshape(np.shape(x) + (len(self),))
+
+    def fraction_inside(self, x, y):
+        '''
+        This function returns the fraction of the points that fall inside each ROI
+        '''
+        if np.size(x) == 0:
+            return dict.fromkeys(self.names, 0.0)
+        return dict(zip(self.names, self.contains(x, y).mean(axis=0).tolist()))
+
+
+#indexes already built, keyed on the ROIs they were built from
+_index_cache = {}
+
+def get_roi_index(shapes):
+    '''
+    This function returns the index for the ROIs, rebuilding it automatically whenever the ROIs change
+    '''
+    key = shapes_key(shapes)
+    if key not in _index_cache:
+        if len(_index_cache) >= 4: #keep the canvas ROIs and a few scaled copies
+            _index_cache.pop(next(iter(_index_cache)))
+        _index_cache[key] = RoiIndex(shapes)
+    return _index_cache[key]
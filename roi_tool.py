@@ -0,0 +1,70 @@
+import argparse
+import os
+import sys
+from batch import containment_mismatch, load_manifest, run_batch, save_results, save_timings, timings_file_path
+from occupancy import CHUNK_FRAMES
+
+'''
+Command line entry point that runs without the GUI, for example:
+
+    python -m roi_tool batch manifest.json --out results.csv --workers 8
+    python -m roi_tool batch manifest.json --stream --chunk-frames 100000
+    python -m roi_tool compare-containment manifest.json --tolerance 0.5
+
+The manifest is the list of saved details exported from the "Saved Details" window.
+'''
+
+
+def batch_command(args):
+    saved_details = load_manifest(args.manifest)
+    results, timings = run_batch(saved_details, workers=args.workers, chunk_frames=args.chunk_frames if args.stream else None,
+                                 cache_tracking=args.cache)
+    save_timings(timings, args.out)
+    print(f"Timings saved to {timings_file_path(args.out)}.")
+    if not results:
+        print("No details were processed.")
+        return 1
+    save_results(results, args.out)
+    print(f"Results saved to {args.out}.")
+    return 0 if len(results) == len(saved_details) else 1
+
+
+def compare_command(args):
+    saved_details = load_manifest(args.manifest)
+    failed = 0
+    for i, details in enumerate(saved_details):
+        name = details.get('name', i + 1)
+        try:
+            mismatch = containment_mismatch(details, args.tolerance)
+        except Exception as e:
+            print(f"Error: Could not compare details '{name}': {e}")
+            failed += 1
+            continue
+        print(f"{name}: " + ", ".join(f"{roi}: {fraction:.4%} of points differ" for roi, fraction in mismatch.items()))
+    return 1 if failed else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='roi_tool', description="Region of Interest Tool command line")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    batch_parser = subparsers.add_parser('batch', help="process a manifest of saved details without the GUI")
+    batch_parser.add_argument('manifest', help="JSON file of saved details exported from the GUI")
+    batch_parser.add_argument('--out', default='results.csv', help="CSV file to save the results to")
+    batch_parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="number of worker processes (default: one per CPU core)")
+    batch_parser.add_argument('--stream', action='store_true', help="read the tracking files in chunks instead of loading them whole, for files too large to fit in memory")
+    batch_parser.add_argument('--chunk-frames', type=int, default=CHUNK_FRAMES, help=f"frames read at a time with --stream (default: {CHUNK_FRAMES})")
+    batch_parser.add_argument('--cache', action='store_true', help="parse the whole tracking files and keep them in the tracking cache so later runs load them faster")
+    batch_parser.set_defaults(func=batch_command)
+
+    compare_parser = subparsers.add_parser('compare-containment', help="check how often the raster containment disagrees with the exact polygon tests")
+    compare_parser.add_argument('manifest', help="JSON file of saved details exported from the GUI")
+    compare_parser.add_argument('--tolerance', type=float, default=None, help="raster tolerance in canvas pixels (default: each detail's own setting)")
+    compare_parser.set_defaults(func=compare_command)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,94 @@
+'''
+This file holds the processing settings that can be changed from the settings window and are saved with batch details
+'''
+
+#default value of each setting, the type of the default is the type the setting is parsed to
+DEFAULT_SETTINGS = {
+    'containment': 'exact', #'exact' polygon tests or 'raster' lookup masks
+    'raster_tolerance': 1.0, #size of a raster mask cell in canvas pixels
+    'min_bout': 0.0, #seconds, shorter bouts in an ROI are dropped
+    'min_gap': 0.0, #seconds, shorter exits between two bouts in an ROI are merged into one bout
+    'hysteresis': 0.0, #canvas pixels a point has to be inside an ROI to enter it and outside to leave it
+    'bin_seconds': 0.0, #seconds, length of the time bins the time in each ROI is split into, 0 for no bins
+    'kinematics': 'off', #'on' adds the path length and mean and max speed of each body part to the batch results
+    'min_likelihood': 0.0, #points with a lower likelihood are masked before the occupancy and kinematics are worked out
+    'max_jump': 0.0, #largest move per frame a body part can make before the point is masked, 0 to keep every point
+    'jump_units': 'pixels', #'pixels' or 'body' lengths of the animal for max_jump
+    'interpolation': 'off', #'linear' or 'cubic' fills short gaps in the positions before the occupancy and kinematics are worked out
+    'max_gap_frames': 5, #longest gap in frames that is filled
+    'smoothing': 'off', #'median', 'savgol' or 'exponential' smooths the positions after the gaps are filled
+    'smoothing_window': 5, #frames in the smoothing window, at least 1, even windows are one frame longer for median and savgol, the span of the exponential filter
+}
+
+#labels shown next to each setting in the settings window
+SETTING_LABELS = {
+    'containment': 'ROI Containment (exact/raster):',
+    'raster_tolerance': 'Raster Tolerance (pixels):',
+    'min_bout': 'Minimum Bout (seconds):',
+    'min_gap': 'Merge Exits Shorter Than (seconds):',
+    'hysteresis': 'Boundary Hysteresis (pixels):',
+    'bin_seconds': 'Time Bin Size (seconds):',
+    'kinematics': 'Kinematics Columns (off/on):',
+    'min_likelihood': 'Minimum Likelihood (0-1):',
+    'max_jump': 'Max Jump per Frame (0 for off):',
+    'jump_units': 'Jump Units (pixels/body):',
+    'interpolation': 'Gap Interpolation (off/linear/cubic):',
+    'max_gap_frames': 'Max Gap to Fill (frames):',
+    'smoothing': 'Smoothing (off/median/savgol/exponential):',
+    'smoothing_window': 'Smoothing Window (frames):',
+}
+
+#settings that only accept a fixed set of values
+SETTING_CHOICES = {
+    'containment': ('exact', 'raster'),
+    'kinematics': ('off', 'on'),
+    'jump_units': ('pixels', 'body'),
+    'interpolation': ('off', 'linear', 'cubic'),
+    'smoothing': ('off', 'median', 'savgol', 'exponential'),
+}
+
+#number settings that have to be more than 0
+POSITIVE_SETTINGS = ('raster_tolerance',)
+
+#smallest value allowed for number settings with a lower limit above 0
+SETTING_MINIMUMS = {
+    'smoothing_window': 1,
+}
+
+#largest value allowed for number settings with an upper limit
+SETTING_MAXIMUMS = {
+    'min_likelihood': 1.0,
+}
+
+
+def parse_setting(key, value):
+    '''
+    This function converts the text entered for a setting to the type of its default and checks it is allowed
+    '''
+    default = DEFAULT_SETTINGS[key]
+    if isinstance(default, str):
+        parsed = str(value).strip().lower()
+    else:
+        parsed = type(default)(value)
+        if parsed < 0:
+            raise ValueError(f"{key} cannot be negative")
+        if key in POSITIVE_SETTINGS and parsed == 0:
+            raise ValueError(f"{key} must be more than 0")
+        if key in SETTING_MINIMUMS and parsed < SETTING_MINIMUMS[key]:
+            raise ValueError(f"{key} cannot be less than {SETTING_MINIMUMS[key]:g}")
+        if key in SETTING_MAXIMUMS and parsed > SETTING_MAXIMUMS[key]:
+            raise ValueError(f"{key} cannot be more than {SETTING_MAXIMUMS[key]:g}")
+
+    if key in SETTING_CHOICES and parsed not in SETTING_CHOICES[key]:
+        raise ValueError(f"{key} must be one of: {', '.join(SETTING_CHOICES[key])}")
+    return parsed
+
+
+def load_settings(saved=None):
+    '''
+    This function fills in any settings missing from saved settings with their defaults
+    '''
+    settings = dict(DEFAULT_SETTINGS)
+    if saved:
+        settings.update({key: parse_setting(key, value) for key, value in saved.items() if key in DEFAULT_SETTINGS})
+    return settings
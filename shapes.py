@@ -18,6 +18,8 @@ class ShapeDrawer:
         self.polygon_points = [] #list to store points for current polygon
         self.current_polygon = None #shapely object for the current polygon
         self.time_counters = {} #Dictionary to keep track of time
+        self.individual_time_counters = {} #Dictionary of the time each individual spent in each ROI for multi animal files
+        self.bout_stats = {} #Dictionary of the entries, latency and bout durations in each ROI
         self.app = app
         self.shift_held = False
         self.color_list = [
@@ -201,6 +203,8 @@ class ShapeDrawer:
         self.polygon_points.clear()
         self.current_polygon = None
         self.time_counters.clear()
+        self.individual_time_counters.clear()
+        self.bout_stats.clear()
         print("All shapes cleared.")
     
     def scale_coordinates(self, rois):
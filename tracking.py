@@ -0,0 +1,151 @@
+import numpy as np
+
+
+def split_body_part(body_part):
+    '''
+    This function splits an "individual:body part" name from a multi animal file into the individual and the body part, the individual is None for single animal files
+    '''
+    individual, separator, part = body_part.partition(':')
+    return (individual, part) if separator else (None, body_part)
+
+
+def individuals_of(body_parts):
+    '''
+    This function returns the individuals that own the body parts in order, empty for single animal body parts
+    '''
+    return list(dict.fromkeys(individual for individual, _ in map(split_body_part, body_parts) if individual is not None))
+
+
+class TrackingData:
+    '''
+    This class holds the DeepLabCut tracking data as one contiguous float32 array of shape (frames, body parts, 3)
+    where the last axis is x, y and likelihood
+    '''
+    COORDS = ('x', 'y', 'likelihood')
+
+    def __init__(self, coords, body_parts, frames, file_body_parts=None):
+        self.coords = coords #(frames, body parts, 3) float32 array, read only and memory mapped when loaded from the cache
+        self.body_parts = list(body_parts) #body parts in the order they appear in the file
+        self.part_index = {body_part: i for i, body_part in enumerate(self.body_parts)} #body part -> position on axis 1
+        self.frames = frames #frame index of each row
+        #every body part in the file, more than body_parts when only some of the columns were loaded
+        self.file_body_parts = self.body_parts if file_body_parts is None else list(file_body_parts)
+
+    @property
+    def total_body_parts(self):
+        return len(self.file_body_parts)
+
+    @property
+    def individuals(self):
+        '''
+        The individuals of a multi animal file in file order, empty for single animal files
+        '''
+        return individuals_of(self.file_body_parts)
+
+    @staticmethod
+    def column_body_part(column):
+        '''
+        This function returns the body part a column belongs to, in multi animal files the individual is part of the name
+        '''
+        if len(column) > 3:
+            return f"{column[-3]}:{column[-2]}"
+        return column[-2]
+
+    @classmethod
+    def from_dataframe(cls, data, file_body_parts=None):
+        '''
+        This function builds the tracking data from the DeepLabCut dataframe with the scorer/bodyparts/coords or scorer/individuals/bodyparts/coords header
+        '''
+        #map each (body part, coordinate) pair to its column, skipping the frame number column
+        lookup = {(cls.column_body_part(col), col[-1]): col for col in data.columns if col[-1] in cls.COORDS}
+        body_parts = list(dict.fromkeys(body_part for body_part, _ in lookup))
+
+        #order the columns as body part major so the values reshape straight into the tensor
+        ordered_columns = [lookup[(body_part, coord)] for body_part in body_parts for coord in cls.COORDS]
+        coords = data[ordered_columns].to_numpy(dtype=np.float32).reshape(len(data), len(body_parts), len(cls.COORDS))
+        frames = data.index.to_numpy(dtype=np.int64)
+        return cls(np.ascontiguousarray(coords), body_parts, frames, file_body_parts)
+
+    def __len__(self):
+        return len(self.frames)
+
+    def rows(self, start_frame, end_frame):
+        '''
+        This function returns the slice of rows for the frames from start_frame to end_frame inclusive
+        '''
+        start = np.searchsorted(self.frames, start_frame, side='left')
+        end = np.searchsorted(self.frames, end_frame, side='right')
+        return slice(int(start), int(end))
+
+    def row(self, frame_index):
+        '''
+        This function returns the row that holds a single frame
+        '''
+        row = int(np.searchsorted(self.frames, frame_index))
+        if row >= len(self.frames) or self.frames[row] != frame_index:
+            raise KeyError(f"Frame {frame_index} is not in the tracking data")
+        return row
+
+    def select(self, body_parts):
+        '''
+        This function returns tracking data holding only the given body parts
+        '''
+        if list(body_parts) == self.body_parts:
+            return self
+        positions = [self.part_index[body_part] for body_part in body_parts]
+        #consecutive body parts are sliced so memory mapped coordinates stay a view, any other selection copies the columns for every row
+        if positions == list(range(positions[0], positions[0] + len(positions))):
+            coords = self.coords[:, positions[0]:positions[0] + len(positions), :]
+        else:
+            coords = self.coords[:, positions, :]
+        return TrackingData(coords, body_parts, self.frames, self.file_body_parts)
+
+
+def frame_coverage(frames, total_frames):
+    '''
+    This function checks which of the video's frames are in the tracking data using the frame index array
+    Missing frames are returned as run length compressed (start, end) ranges
+    '''
+    unique_frames, frame_counts = np.unique(frames, return_counts=True)
+    in_video = (unique_frames >= 0) & (unique_frames < total_frames)
+
+    #mark the frames that are present and find where runs of missing frames start and end
+    missing = np.ones(total_frames, dtype=bool)
+    missing[unique_frames[in_video]] = False
+    edges = np.diff(np.concatenate(([0], missing.view(np.int8), [0])))
+    range_starts = np.flatnonzero(edges == 1)
+    range_ends = np.flatnonzero(edges == -1) - 1
+
+    return {
+        'video_frames': int(total_frames),
+        'tracked_frames': int(len(frames)),
+        'frame_count_difference': int(len(frames) - total_frames),
+        'missing_frames': int(missing.sum()),
+        'missing_ranges': list(zip(range_starts.tolist(), range_ends.tolist())),
+        'duplicate_frames': unique_frames[frame_counts > 1].tolist(),
+        'frames_outside_video': unique_frames[~in_video].tolist(),
+    }
+
+
+def format_coverage(coverage, max_ranges=20):
+    '''
+    This function formats the frame coverage as a short summary for the console and the debug log
+    '''
+    def format_ranges(ranges):
+        text = ", ".join(f"{start}" if start == end else f"{start}-{end}" for start, end in ranges[:max_ranges])
+        return text + (f", ... ({len(ranges) - max_ranges} more)" if len(ranges) > max_ranges else "")
+
+    lines = [
+        "Frame coverage:",
+        f"  Video frames: {coverage['video_frames']}",
+        f"  Tracked frames: {coverage['tracked_frames']} ({coverage['frame_count_difference']:+d} compared to the video)",
+    ]
+    if coverage['missing_frames']:
+        lines.append(f"  Missing frames: {coverage['missing_frames']} in {len(coverage['missing_ranges'])} ranges: {format_ranges(coverage['missing_ranges'])}")
+    if coverage['duplicate_frames']:
+        lines.append(f"  Duplicate frames: {len(coverage['duplicate_frames'])}: {format_ranges([(f, f) for f in coverage['duplicate_frames']])}")
+    if coverage['frames_outside_video']:
+        lines.append(f"  Frames past the end of the video: {len(coverage['frames_outside_video'])}: {format_ranges([(f, f) for f in coverage['frames_outside_video']])}")
+    if not (coverage['missing_frames'] or coverage['duplicate_frames'] or coverage['frames_outside_video']):
+        lines.append("  All frames are present in the file.")
+    return "\n".join(lines)
@@ -0,0 +1,99 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+import numpy as np
+
+'''
+This file keeps already parsed tracking files in a cache directory so loading the same file again skips the csv/h5 parsing.
+Each entry is a folder holding the float32 coordinate tensor and the frame index as .npy files, which can be memory mapped, and the body parts in meta.json.
+'''
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.roi_tool', 'tracking_cache')
+MAX_CACHE_BYTES = 2 * 1024 ** 3 #oldest entries are removed once the cache grows past this size
+SAMPLE_BYTES = 1024 ** 2 #bytes read from the start and end of a file for its content hash
+CACHE_VERSION = 2 #bump when the layout of an entry changes so old entries are ignored
+
+
+def cache_key(file_path):
+    '''
+    This function returns the key of a tracking file built from its path, size, modification time and a hash of its first and last bytes
+    '''
+    stat = os.stat(file_path)
+    digest = hashlib.sha1()
+    digest.update(f"{CACHE_VERSION}:{os.path.abspath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    with open(file_path, 'rb') as f:
+        digest.update(f.read(SAMPLE_BYTES))
+        if stat.st_size > SAMPLE_BYTES:
+            f.seek(max(stat.st_size - SAMPLE_BYTES, SAMPLE_BYTES))
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def load_entry(file_path, mmap_mode=None, cache_dir=None):
+    '''
+    This function returns the cached coordinates, body parts and frames of a tracking file, or None if it isn't cached
+    '''
+    cache_dir = cache_dir or CACHE_DIR
+    entry_dir = os.path.join(cache_dir, cache_key(file_path))
+    try:
+        with open(os.path.join(entry_dir, 'meta.json'), 'r') as f:
+            meta = json.load(f)
+        coords = np.load(os.path.join(entry_dir, 'coords.npy'), mmap_mode=mmap_mode)
+        frames = np.load(os.path.join(entry_dir, 'frames.npy'), mmap_mode=mmap_mode)
+    except (OSError, ValueError):
+        return None
+    try:
+        os.utime(os.path.join(entry_dir, 'meta.json')) #mark the entry as recently used for eviction
+    except OSError:
+        pass #a read only cache can still be loaded from, its entries just aren't marked as used
+    return coords, meta['body_parts'], frames
+
+
+def store_entry(file_path, coords, body_parts, frames, cache_dir=None, max_bytes=MAX_CACHE_BYTES):
+    '''
+    This function writes a parsed tracking file to the cache and evicts the least recently used entries if the cache is too big
+    '''
+    cache_dir = cache_dir or CACHE_DIR
+    entry_dir = os.path.join(cache_dir, cache_key(file_path))
+    if os.path.isdir(entry_dir):
+        return
+
+    #write to a temporary folder first so a half written entry is never loaded
+    temp_dir = os.path.join(cache_dir, f"tmp-{uuid.uuid4().hex}")
+    try:
+        os.makedirs(temp_dir)
+        np.save(os.path.join(temp_dir, 'coords.npy'), coords)
+        np.save(os.path.join(temp_dir, 'frames.npy'), frames)
+        with open(os.path.join(temp_dir, 'meta.json'), 'w') as f:
+            json.dump({'source': os.path.abspath(file_path), 'body_parts': list(body_parts)}, f)
+        os.rename(temp_dir, entry_dir)
+    except OSError as e:
+        #another process may have stored the same file first, the cache is only an optimization so carry on
+        print(f"Could not cache tracking file {file_path}: {e}")
+        shutil.rmtree(temp_dir, ignore_errors=True)
+        return
+    evict(max_bytes, cache_dir)
+
+
+def entry_size(entry_dir):
+    return sum(entry.stat().st_size for entry in os.scandir(entry_dir) if entry.is_file())
+
+
+def evict(max_bytes=MAX_CACHE_BYTES, cache_dir=None):
+    '''
+    This function removes the least recently used entries until the cache fits in max_bytes
+    '''
+    entries = []
+    for entry in os.scandir(cache_dir or CACHE_DIR):
+        meta_path = os.path.join(entry.path, 'meta.json')
+        if entry.is_dir() and os.path.exists(meta_path):
+            entries.append((os.path.getmtime(meta_path), entry_size(entry.path), entry.path))
+
+    total_bytes = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total_bytes -= size